@@ -1,21 +1,48 @@
 import os
 import sys
-import socket
-import getpass
 import shlex
-import tkinter as tk
-from tkinter import scrolledtext
 import argparse
+import itertools
+from collections import deque
 
-USER = getpass.getuser()
-HOST = socket.gethostname()
+def current_user() -> str:
+    """getpass.getuser() without importing getpass when the environment has the name."""
+    for name in ("LOGNAME", "USER", "LNAME", "USERNAME"):
+        if os.environ.get(name):
+            return os.environ[name]
+    import getpass
+    return getpass.getuser()
+
+def host_name() -> str:
+    """socket.gethostname() without importing socket where os.uname() exists."""
+    if hasattr(os, "uname"):
+        return os.uname().nodename
+    import socket
+    return socket.gethostname()
+
+USER = current_user()
+HOST = host_name()
 HOME = os.path.expanduser("~")
 
 config = {
     "vfs_path": None,
-    "startup_script": None
+    "startup_script": None,
+    "scrollback": 10000,
+    "tail": False,
+    "no_gui": False
 }
 
+# Text written since the last flush_output()
+pending_output = []
+
+# Tail mode: the last config['scrollback'] lines of output; the Text widget
+# only shows the window that is offset lines above the end
+scrollback = deque()
+tail_view = {"offset": 0, "line_height": 1}
+
+# Widgets created by initialize_gui(); root stays None with --no-gui
+root = out = inpe = prompt_lbl = None
+
 def prompt_path():
     return "~"
 
@@ -23,11 +50,71 @@ def build_prompt() -> str:
     return f"{USER}@{HOST}:{prompt_path()}$ "
 
 def write_out(text: str):
+    if root is None:
+        sys.stdout.write(text)
+        return
+    
+    # Inserted in one piece per event-loop tick by flush_output()
+    if not pending_output:
+        root.after(0, flush_output)
+    pending_output.append(text)
+
+def flush_output():
+    text = "".join(pending_output)
+    pending_output.clear()
+    
+    if config['tail']:
+        append_scrollback(text)
+        tail_view["offset"] = 0
+        render_tail()
+        return
+    
     out.config(state=tk.NORMAL)
     out.insert(tk.END, text)
+    trim_output()
     out.config(state=tk.DISABLED)
     out.see(tk.END)
 
+def trim_output():
+    """Drop the oldest lines once the pane is a tenth over the scrollback limit."""
+    limit = config['scrollback']
+    if not limit:
+        return
+    
+    lines = int(out.index("end-1c").split(".")[0])
+    if lines > limit + limit // 10:
+        out.delete("1.0", f"{lines - limit + 1}.0")
+
+def append_scrollback(text: str):
+    lines = text.splitlines(keepends=True)
+    if not lines:
+        return
+    
+    # A prompt is written without a newline; the next write completes its line
+    if scrollback and not scrollback[-1].endswith("\n"):
+        lines[0] = scrollback.pop() + lines[0]
+    scrollback.extend(lines)
+
+def render_tail():
+    height = out.winfo_height()
+    if height > 1:
+        visible = max(1, height // tail_view["line_height"])
+    else:
+        visible = int(out.cget("height"))
+    
+    end = len(scrollback) - tail_view["offset"]
+    start = max(0, end - visible)
+    
+    out.config(state=tk.NORMAL)
+    out.delete("1.0", tk.END)
+    out.insert(tk.END, "".join(itertools.islice(scrollback, start, end)))
+    out.config(state=tk.DISABLED)
+
+def scroll_tail(lines: int):
+    tail_view["offset"] = min(max(0, tail_view["offset"] + lines), max(0, len(scrollback) - 1))
+    render_tail()
+    return "break"
+
 def execute_command(cmd: str, args: list) -> bool:
     if cmd == "ls":
         write_out(f"ls args: {args}\n")
@@ -41,6 +128,8 @@ def execute_command(cmd: str, args: list) -> bool:
         write_out(f"startup_script = {config['startup_script']}\n")
         return True
     elif cmd == "exit":
+        if root is None:
+            sys.exit(0)
         root.after(50, root.destroy)
         return True
     else:
@@ -48,7 +137,9 @@ def execute_command(cmd: str, args: list) -> bool:
         return False
 
 def handle_command(line: str):
-    write_out(build_prompt() + line + "\n")
+    # Without a window the terminal has already echoed the line after the prompt
+    if root is not None:
+        write_out(build_prompt() + line + "\n")
     
     if not line.strip():
         return
@@ -108,22 +199,45 @@ def on_enter(event=None):
     inpe.delete(0, tk.END)
     handle_command(line)
 
+def run_headless():
+    """Read commands from stdin instead of the window, for scripted runs."""
+    while True:
+        try:
+            line = input(build_prompt())
+        except EOFError:
+            write_out("\n")
+            break
+        handle_command(line)
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description='OS Shell Emulator')
     parser.add_argument('--vfs', dest='vfs_path', 
                         help='Path to VFS location')
     parser.add_argument('--startup', dest='startup_script',
                         help='Path to startup script')
+    parser.add_argument('--scrollback', type=int, default=config['scrollback'],
+                        help='Lines of output kept in the window (0 keeps everything)')
+    parser.add_argument('--tail', action='store_true',
+                        help='Render only the visible lines of the scrollback buffer')
+    parser.add_argument('--no-gui', dest='no_gui', action='store_true',
+                        help='Run in the terminal without importing tkinter')
     
     args = parser.parse_args()
     
+    config['scrollback'] = args.scrollback
+    config['tail'] = args.tail
+    config['no_gui'] = args.no_gui
+    
     if args.vfs_path:
         config['vfs_path'] = args.vfs_path
     if args.startup_script:
         config['startup_script'] = args.startup_script
 
 def initialize_gui():
-    global root, out, inpe, prompt_lbl
+    global root, out, inpe, prompt_lbl, scrollback, tk, scrolledtext, tkfont
+    import tkinter as tk
+    from tkinter import scrolledtext
+    from tkinter import font as tkfont
     
     root = tk.Tk()
     root.title("Console Emulator (Stage 2: Configuration)")
@@ -148,11 +262,20 @@ def initialize_gui():
     out = scrolledtext.ScrolledText(main, height=25, width=80, font=("Courier", 11))
     out.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
     out.config(state=tk.DISABLED)
+    
+    if config['tail']:
+        scrollback = deque(maxlen=config['scrollback'] or None)
+        tail_view["line_height"] = tkfont.Font(font=out.cget("font")).metrics("linespace")
+        out.bind("<MouseWheel>", lambda e: scroll_tail(3 if e.delta > 0 else -3))
+        out.bind("<Button-4>", lambda e: scroll_tail(3))
+        out.bind("<Button-5>", lambda e: scroll_tail(-3))
+        out.bind("<Configure>", lambda e: render_tail())
 
 def main():
     parse_arguments()
     
-    initialize_gui()
+    if not config['no_gui']:
+        initialize_gui()
     
     write_out(f"VFS Path: {config['vfs_path']}\n")
     write_out(f"Startup Script: {config['startup_script']}\n")
@@ -161,6 +284,10 @@ def main():
     if config['startup_script']:
         execute_startup_script(config['startup_script'])
     
+    if root is None:
+        run_headless()
+        return
+    
     write_out(build_prompt())
     inpe.focus()
     
@@ -2,99 +2,1162 @@
 
 import os
 import sys
-import socket
-import getpass
-import shlex
 import argparse
-import xml.etree.ElementTree as ET
-import base64
+import binascii
+import mmap
+import struct
+import zlib
+import re
+import fnmatch
+import threading
+import io
+import codecs
+import math
+import time
+import atexit
+from collections import OrderedDict, deque
+from functools import lru_cache
 
-USER = getpass.getuser()
-HOST = socket.gethostname()
+def current_user() -> str:
+    """getpass.getuser() without importing getpass when the environment has the name."""
+    for name in ("LOGNAME", "USER", "LNAME", "USERNAME"):
+        if os.environ.get(name):
+            return os.environ[name]
+    import getpass
+    return getpass.getuser()
+
+def host_name() -> str:
+    """socket.gethostname() without importing socket where os.uname() exists."""
+    if hasattr(os, "uname"):
+        return os.uname().nodename
+    import socket
+    return socket.gethostname()
+
+USER = current_user()
+HOST = host_name()
 HOME = os.path.expanduser("~")
 
 config = {
     "vfs_path": None,
-    "startup_script": None
+    "startup_script": None,
+    "content_cache_size": 64,
+    "mmap_content": False,
+    "compile": None,
+    "load_workers": 1,
+    "history_size": 10000,
+    "history_file": os.path.join(HOME, ".konfig_history"),
+    "record_script_history": True,
+    "serve": None,
+    "profile_json": None,
+    "grep_index": True,
+    "script_cache_dir": os.path.join(HOME, ".cache", "konfig", "scripts")
 }
 
 vfs = {
     "name": "default_vfs",
     "current_dir": "/",
-    "files": {}
+    "root": None,
+    "store": None,
+    "owners": None,
+    # path -> VfsNode shadowing the base tree; the base is never modified
+    "overlay": None,
+    # Trigram index of file bodies, built by the first indexed grep
+    "grep_index": None,
+    # directory path -> [bytes, files] of its subtree, built by the first
+    # du or ls -l, see size_index()
+    "sizes": None,
+    # Bumped by every install_vfs()
+    "generation": 0
 }
 
-command_history = []
+# Command history: (number, line) pairs, at most config['history_size'] of
+# them. Lines are appended to config['history_file'] as they are entered
+# and the file is read back on first use, see load_history().
+command_history = deque()
 
-def load_vfs_from_xml(xml_path: str) -> bool:
-    try:
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
-        
-        vfs["name"] = root.get("name", "vfs")
-        vfs["files"] = {}
-        
-        def parse_node(node, path="/"):
-            for child in node:
-                if child.tag == "file":
-                    name = child.get("name")
-                    content = child.text or ""
-                    owner = child.get("owner", USER)
-                    group = child.get("group", "users")
-                    
-                    if child.get("encoding") == "base64":
-                        try:
-                            content = base64.b64decode(content).decode('utf-8')
-                        except:
-                            pass
-                    
-                    file_path = os.path.join(path, name).replace("\\", "/")
-                    vfs["files"][file_path] = {
-                        "type": "file",
-                        "content": content,
-                        "name": name,
-                        "owner": owner,
-                        "group": group
-                    }
-                    
-                elif child.tag == "directory":
-                    name = child.get("name")
-                    owner = child.get("owner", USER)
-                    group = child.get("group", "users")
-                    
-                    dir_path = os.path.join(path, name).replace("\\", "/")
-                    vfs["files"][dir_path] = {
-                        "type": "directory",
-                        "name": name,
-                        "owner": owner,
-                        "group": group
-                    }
-                    parse_node(child, dir_path)
-        
-        parse_node(root)
-        vfs["current_dir"] = "/"
+# "lines" maps each distinct line in command_history to the numbers it was
+# entered under; "trigrams" maps three-character pieces to distinct lines
+# and is built by the first search
+history_index = {
+    "next": 1,
+    "lines": {},
+    "trigrams": None,
+    "loaded": False,
+    "file": None
+}
+
+# Timings per command name and per load phase ("load:parse", "load:index",
+# "decode"), recorded while "enabled"; see record_timing() and set_profiling()
+profile = {
+    "enabled": False,
+    "timings": {}
+}
+
+# id(node) -> (node, decoded text); the node is kept so its id cannot be reused
+decoded_cache = OrderedDict()
+
+# State of the last `vfs-load --async`, written by the worker thread and
+# consumed by the main thread between commands. "generation" is the value of
+# vfs["generation"] when the load started; a result is only installed if no
+# other VFS was installed in the meantime. "session" is the --serve session
+# that started the load, None outside --serve.
+background_load = {
+    "thread": None,
+    "path": None,
+    "mmap_content": False,
+    "progress": None,
+    "result": None,
+    "error": None,
+    "generation": 0,
+    "session": None
+}
+
+# Parsers update "bytes"/"nodes" every PROGRESS_INTERVAL nodes
+PROGRESS_INTERVAL = 1024
+
+# Resolved (current_dir, path) pairs kept by resolve_path()
+PATH_CACHE_SIZE = 4096
+
+# Command lines whose shlex-split words are kept by parse_command_line()
+PARSED_LINE_CACHE_SIZE = 1024
+
+# Timing histograms have PROFILE_BUCKETS_PER_OCTAVE buckets per doubling of
+# microseconds, so percentiles are exact to within about 9%
+PROFILE_BUCKETS_PER_OCTAVE = 8
+PROFILE_BUCKETS = 40 * PROFILE_BUCKETS_PER_OCTAVE
+
+# Characters of command output collected by BufferedOutput before a write
+OUTPUT_BUFFER_SIZE = 64 * 1024
+
+# Bumped whenever the cached layout of compiled startup scripts changes
+SCRIPT_CACHE_VERSION = 3
+
+# wc and other streaming readers decode file bodies in pieces of this size
+TEXT_CHUNK_SIZE = 64 * 1024
+
+# count_text() maps the UTF-8 bytes of each piece through this table,
+# whitespace (as str.isspace() has it) to b" " and anything else to b"x",
+# so words start at b" x". Non-ASCII whitespace is first replaced with " "
+# (\s in a str pattern is str.isspace()); every other non-ASCII character
+# only has bytes >= 0x80, which map to b"x".
+WORD_CLASS_TABLE = bytes(0x20 if chr(i).isspace() else 0x78 for i in range(256))
+NON_ASCII_SPACE = re.compile(r"[^\S\x00-\x7f]")
+
+# base64 bodies up to this many encoded characters are decoded whole and kept
+# in decoded_cache; longer ones are always streamed
+DECODED_CACHE_MAX_BODY = 1024 * 1024
+
+# Documents smaller than this are not worth shipping to worker processes
+PARALLEL_LOAD_MIN_BYTES = 4 * 1024 * 1024
+
+# grep scans at least this many files in worker processes when --load-workers allows
+GREP_PARALLEL_MIN_FILES = 20000
+
+# A grep pattern without these characters is a literal string
+GREP_SPECIAL_CHARS = frozenset(".^$*+?{}[]\\|()")
+
+NODE_DIRECTORY = 1
+NODE_BASE64 = 2
+NODE_MAPPED = 4
+
+# Owner and group names shared by every node; nodes store indexes into this
+# table. Appends are locked because a background vfs-load may add names.
+principal_names = []
+principal_ids = {}
+principal_lock = threading.Lock()
+
+def principal_id(name: str) -> int:
+    pid = principal_ids.get(name)
+    if pid is None:
+        with principal_lock:
+            pid = principal_ids.get(name)
+            if pid is None:
+                pid = len(principal_names)
+                principal_names.append(name)
+                principal_ids[name] = pid
+    return pid
+
+class VfsNode:
+    """A file or directory of the VFS tree.
+
+    Slots instead of a per-node dict: the name is interned, owner and group
+    are indexes into principal_names and the kind and encoding are bits of
+    flags. data is the children dict of a directory, the text of an
+    in-memory file, or the mmap of a mapped file, whose body is then
+    data[offset:offset + length].
+    """
+    __slots__ = ("name", "flags", "owner_id", "group_id", "data", "offset", "length")
+    
+    def __init__(self, name: str, flags: int, owner: str, group: str, data, offset: int = 0, length: int = 0):
+        self.name = sys.intern(name)
+        self.flags = flags
+        self.owner_id = principal_id(owner)
+        self.group_id = principal_id(group)
+        self.data = data
+        self.offset = offset
+        self.length = length
+    
+    def __reduce__(self):
+        # Owner and group travel by name: ids are only valid in this process
+        return (VfsNode, (self.name, self.flags, self.owner, self.group, self.data, self.offset, self.length))
+    
+    @property
+    def type(self) -> str:
+        return "directory" if self.flags & NODE_DIRECTORY else "file"
+    
+    @property
+    def children(self):
+        return self.data if self.flags & NODE_DIRECTORY else None
+    
+    @property
+    def encoding(self):
+        return "base64" if self.flags & NODE_BASE64 else None
+    
+    @property
+    def owner(self) -> str:
+        return principal_names[self.owner_id]
+    
+    @owner.setter
+    def owner(self, name: str):
+        self.owner_id = principal_id(name)
+    
+    @property
+    def group(self) -> str:
+        return principal_names[self.group_id]
+    
+    @group.setter
+    def group(self, name: str):
+        self.group_id = principal_id(name)
+
+def new_directory_node(name: str, owner: str, group: str) -> VfsNode:
+    return VfsNode(name, NODE_DIRECTORY, owner, group, {})
+
+def new_file_node(name: str, owner: str, group: str, content: str, encoding: str = None) -> VfsNode:
+    return VfsNode(name, NODE_BASE64 if encoding == "base64" else 0, owner, group, content)
+
+def new_mapped_file_node(name: str, owner: str, group: str, source, offset: int, length: int,
+                         encoding: str = None) -> VfsNode:
+    """File node whose body is the byte range [offset, offset + length) of source."""
+    flags = NODE_MAPPED | (NODE_BASE64 if encoding == "base64" else 0)
+    return VfsNode(name, flags, owner, group, source, offset, length)
+
+def new_content_store() -> dict:
+    """Content-addressed store of in-memory file bodies.
+
+    Bodies are keyed by their text (dict hashing plus an equality check), so
+    identical files share one str. Each entry is (text, utf-8 size); entries
+    live as long as the store, which is dropped together with its tree.
+    """
+    return {
+        "blobs": {},
+        "logical": 0,
+        "physical": 0
+    }
+
+def acquire_content(store: dict, text: str) -> str:
+    """Count one more file with body text and return the shared copy to keep in the node."""
+    entry = store["blobs"].get(text)
+    if entry is None:
+        size = len(text) if text.isascii() else len(text.encode('utf-8'))
+        entry = store["blobs"][text] = (text, size)
+        store["physical"] += size
+    
+    store["logical"] += entry[1]
+    return entry[0]
+
+def new_owner_index() -> dict:
+    """Reverse index from owner and group ids to the nodes that carry them.
+
+    index["owner"][owner_id] and index["group"][group_id] map absolute paths
+    to nodes, so `find -user/-group` never has to walk the whole tree.
+    """
+    return {"owner": {}, "group": {}}
+
+def index_node(index: dict, path: str, node: VfsNode):
+    index["owner"].setdefault(node.owner_id, {})[path] = node
+    index["group"].setdefault(node.group_id, {})[path] = node
+
+def walk_subtree(path: str, node: VfsNode, overlay: dict = None):
+    """Yield (path, node) for node and everything below it.
+
+    Nodes shadowed in overlay are yielded in their overlay version.
+    """
+    stack = [(path, node)]
+    while stack:
+        path, node = stack.pop()
+        if overlay:
+            node = overlay.get(path, node)
+        yield path, node
+        if node.children:
+            prefix = path.rstrip("/") + "/"
+            for name, child in node.children.items():
+                stack.append((prefix + name, child))
+
+def build_owner_index(vfs_root: VfsNode) -> dict:
+    index = new_owner_index()
+    for path, node in walk_subtree("/", vfs_root):
+        index_node(index, path, node)
+    return index
+
+def indexed_under(index: dict, overlay: dict, kind: str, name: str, base: str) -> list:
+    """(path, node) pairs at or below base whose owner or group (kind) is name.
+
+    The index covers the immutable base tree; overlay entries take precedence
+    over it and the overlay (small next to the tree) is scanned as a whole.
+    """
+    pid = principal_ids.get(name)
+    if pid is None:
+        return []
+    
+    attr = kind + "_id"
+    prefix = base.rstrip("/") + "/"
+    entries = index[kind].get(pid, {})
+    result = []
+    
+    for path, node in entries.items():
+        if path == base or path.startswith(prefix):
+            node = overlay.get(path, node)
+            if getattr(node, attr) == pid:
+                result.append((path, node))
+    
+    for path, node in overlay.items():
+        if getattr(node, attr) == pid and path not in entries and (path == base or path.startswith(prefix)):
+            result.append((path, node))
+    
+    return result
+
+def shadow_node(overlay: dict, path: str, node: VfsNode) -> VfsNode:
+    """Copy of a base node recorded in overlay, for changes that stay private.
+
+    The copy shares the children dict or body of the base node. It takes no
+    reference in the content store: the base node keeps the body alive and
+    vfs-stats counts it once, however many sessions shadow it.
+    """
+    copy = VfsNode.__new__(VfsNode)
+    for attr in VfsNode.__slots__:
+        setattr(copy, attr, getattr(node, attr))
+    
+    overlay[path] = copy
+    return copy
+
+def reset_overlay(overlay: dict) -> int:
+    """Drop every change recorded in overlay; returns how many nodes it held."""
+    count = len(overlay)
+    overlay.clear()
+    return count
+
+def fold_overlay(overlay: dict):
+    """Make the changes recorded in overlay part of the base tree and clear it.
+    
+    --serve calls this once before accepting clients, so what the startup
+    script changed is the base every session starts from.
+    """
+    index = vfs["owners"]
+    
+    for path, node in overlay.items():
+        if path == "/":
+            old = vfs["root"]
+            vfs["root"] = node
+        else:
+            parent = vfs["root"]
+            parts = path.split("/")
+            for part in parts[1:-1]:
+                parent = parent.children[part]
+            old = parent.children[parts[-1]]
+            parent.children[parts[-1]] = node
         
-        print(f"VFS '{vfs['name']}' loaded successfully from {xml_path}")
-        return True
+        for kind in ("owner", "group"):
+            attr = kind + "_id"
+            index[kind][getattr(old, attr)].pop(path, None)
+            index[kind].setdefault(getattr(node, attr), {})[path] = node
+    
+    overlay.clear()
+
+def set_principal(overlay: dict, entries: list, kind: str, name: str) -> int:
+    """Set the owner or group (kind) of every (path, node) in entries.
+
+    Nodes already shadowed in overlay are changed in place, base nodes are
+    shadowed first. Returns how many nodes changed.
+    """
+    attr = kind + "_id"
+    new_id = principal_id(name)
+    changed = 0
+    
+    for path, node in entries:
+        node = overlay.get(path, node)
+        if getattr(node, attr) == new_id:
+            continue
+        if overlay.get(path) is not node:
+            node = shadow_node(overlay, path, node)
+        setattr(node, attr, new_id)
+        changed += 1
+    
+    return changed
+
+def file_size(store: dict, node: VfsNode) -> int:
+    """UTF-8 size of the text of a file node, without decoding its body.
+
+    In-memory bodies take the size recorded in store; base64 bodies are
+    sized from the number of base64 digits.
+    """
+    if node.flags & NODE_BASE64:
+        raw = read_file_body(node)
+        if isinstance(raw, memoryview):
+            digits = b"".join(raw.tobytes().split())
+            padding = len(digits) - len(digits.rstrip(b"="))
+        else:
+            digits = "".join(raw.split())
+            padding = len(digits) - len(digits.rstrip("="))
+        return len(digits) // 4 * 3 - padding
+    
+    if node.flags & NODE_MAPPED:
+        return node.length
+    
+    entry = store["blobs"].get(node.data)
+    if entry is not None:
+        return entry[1]
+    return len(node.data) if node.data.isascii() else len(node.data.encode('utf-8'))
+
+def build_size_index(store: dict, vfs_root: VfsNode) -> dict:
+    """Total size and file count of every directory's subtree, keyed by path.
+    
+    Each entry is [bytes, files]. Built in one pass: every directory is
+    visited with its parent's entry and before anything below it, so going
+    through them backwards adds every subtree to its parent after the
+    subtree is complete.
+    """
+    sizes = {}
+    # (entry, parent's entry) of every directory in visiting order
+    order = []
+    stack = [("/", vfs_root, None)]
+    
+    while stack:
+        path, node, parent = stack.pop()
+        totals = sizes[path] = [0, 0]
+        order.append((totals, parent))
+        prefix = path.rstrip("/") + "/"
+        for name, child in node.children.items():
+            if child.flags & NODE_DIRECTORY:
+                stack.append((prefix + name, child, totals))
+            else:
+                totals[0] += file_size(store, child)
+                totals[1] += 1
+    
+    for totals, parent in reversed(order[1:]):
+        parent[0] += totals[0]
+        parent[1] += totals[1]
+    
+    return sizes
+
+def size_index() -> dict:
+    """vfs["sizes"], built on first use: sizing base64 bodies reads them all."""
+    if vfs["sizes"] is None:
+        start = time.perf_counter()
+        vfs["sizes"] = build_size_index(vfs["store"], vfs["root"])
+        if profile["enabled"]:
+            record_timing("size:index", time.perf_counter() - start)
+    return vfs["sizes"]
+
+vfs["root"] = new_directory_node("/", USER, "users")
+vfs["store"] = new_content_store()
+vfs["owners"] = build_owner_index(vfs["root"])
+vfs["overlay"] = {}
+
+def parse_vfs_stream(xml_path: str, store: dict, progress: dict = None):
+    """Build the VFS tree with iterparse, dropping each element once it is consumed.
+
+    Only the chain of currently open elements is kept, so neither memory nor
+    the recursion limit depends on the size or depth of the document.
+    File bodies are interned in store; progress, if given, receives the
+    number of bytes read and nodes parsed so far.
+    Returns a (vfs_name, root_node) pair.
+    """
+    with open(xml_path, 'rb') as f:
+        return parse_vfs_file(f, store, progress)
+
+def parse_vfs_file(f, store: dict, progress: dict = None):
+    """parse_vfs_stream() over an already opened binary file object."""
+    import xml.etree.ElementTree as ET
+    vfs_name = "vfs"
+    vfs_root = new_directory_node("/", USER, "users")
+    
+    # One entry per open element: (element, directory node or None when skipped)
+    stack = []
+    nodes = 0
+    
+    for event, elem in ET.iterparse(f, events=("start", "end")):
+        if event == "start":
+            if not stack:
+                vfs_name = elem.get("name", "vfs")
+                stack.append((elem, vfs_root))
+                continue
+            
+            parent = stack[-1][1]
+            node = None
+            
+            if parent is not None and elem.tag == "directory":
+                name = elem.get("name")
+                if name is None:
+                    raise ValueError("<directory> element without a name attribute")
+                
+                node = new_directory_node(name, elem.get("owner", USER), elem.get("group", "users"))
+                parent.children[name] = node
+                nodes += 1
+            
+            stack.append((elem, node))
+            continue
         
-    except FileNotFoundError:
-        print(f"ERROR: VFS file not found: {xml_path}")
-        return False
-    except ET.ParseError as e:
-        print(f"ERROR: Invalid XML format: {e}")
+        stack.pop()
+        if not stack:
+            break
+        
+        parent_elem, parent = stack[-1]
+        
+        if parent is not None and elem.tag == "file":
+            name = elem.get("name")
+            if name is None:
+                raise ValueError("<file> element without a name attribute")
+            
+            # base64 bodies stay encoded until read, see decode_file_content()
+            encoding = "base64" if elem.get("encoding") == "base64" else None
+            
+            content = acquire_content(store, elem.text or "")
+            parent.children[name] = new_file_node(
+                name, elem.get("owner", USER), elem.get("group", "users"), content, encoding)
+            nodes += 1
+            
+            if progress is not None and nodes % PROGRESS_INTERVAL == 0:
+                progress["nodes"] = nodes
+                progress["bytes"] = f.tell()
+        
+        # Earlier siblings were already detached, so this only drops elem itself
+        elem.clear()
+        del parent_elem[:]
+    
+    if progress is not None:
+        progress["nodes"] = nodes
+        progress["bytes"] = f.tell()
+    
+    return vfs_name, vfs_root
+
+def parse_vfs_mapped(xml_path: str, store: dict, progress: dict = None):
+    """Build the VFS tree keeping file bodies in an mmap of the XML file.
+
+    Each <file> only records the byte offset and length of its text, so
+    memory scales with the number of nodes rather than with content size.
+    Bodies whose raw bytes differ from their parsed text (entities, CDATA,
+    comments, CR line endings) are parsed individually and interned in store.
+    Returns a (vfs_name, root_node) pair like parse_vfs_stream().
+    """
+    import xml.etree.ElementTree as ET
+    import xml.parsers.expat as expat
+    with open(xml_path, 'rb') as f:
+        source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    vfs_root = new_directory_node("/", USER, "users")
+    state = {"name": "vfs", "file": None, "nodes": 0}
+    # Directory node per open element, None for files and skipped elements
+    stack = []
+    parser = expat.ParserCreate()
+    
+    def on_xml_decl(version, encoding, standalone):
+        if encoding and encoding.lower().replace("-", "") != "utf8":
+            raise ValueError(f"mmap loading requires a UTF-8 VFS file, got {encoding}")
+    
+    def on_start(tag, attrs):
+        if not stack:
+            state["name"] = attrs.get("name", "vfs")
+            stack.append(vfs_root)
+            return
+        
+        pending = state["file"]
+        if pending is not None and pending["end"] is None:
+            # Like ElementTree, only the text before the first child counts
+            pending["end"] = parser.CurrentByteIndex if pending["start"] is not None else -1
+        
+        parent = stack[-1]
+        node = None
+        
+        if parent is not None and tag == "directory":
+            name = attrs.get("name")
+            if name is None:
+                raise ValueError("<directory> element without a name attribute")
+            
+            node = new_directory_node(name, attrs.get("owner", USER), attrs.get("group", "users"))
+            parent.children[name] = node
+            state["nodes"] += 1
+        
+        elif parent is not None and tag == "file":
+            if attrs.get("name") is None:
+                raise ValueError("<file> element without a name attribute")
+            
+            state["file"] = {"parent": parent, "attrs": attrs, "depth": len(stack),
+                             "start": None, "end": None}
+        
+        stack.append(node)
+    
+    def on_text(*_):
+        # Also bound to CDATA, comment and PI events so start covers their markup
+        pending = state["file"]
+        if pending is not None and pending["start"] is None and pending["end"] is None:
+            pending["start"] = parser.CurrentByteIndex
+    
+    def on_end(tag):
+        stack.pop()
+        pending = state["file"]
+        if pending is None or pending["depth"] != len(stack):
+            return
+        
+        state["file"] = None
+        attrs = pending["attrs"]
+        name = attrs["name"]
+        owner = attrs.get("owner", USER)
+        group = attrs.get("group", "users")
+        encoding = "base64" if attrs.get("encoding") == "base64" else None
+        
+        start = pending["start"]
+        end = pending["end"]
+        if end is None:
+            end = parser.CurrentByteIndex
+        
+        if start is None or end < 0:
+            node = new_file_node(name, owner, group, acquire_content(store, ""), encoding)
+        elif (source.find(b"&", start, end) < 0 and source.find(b"<", start, end) < 0
+                and source.find(b"\r", start, end) < 0):
+            node = new_mapped_file_node(name, owner, group, source, start, end - start, encoding)
+        else:
+            text = ET.fromstring(b"<file>" + source[start:end] + b"</file>").text or ""
+            node = new_file_node(name, owner, group, acquire_content(store, text), encoding)
+        
+        pending["parent"].children[name] = node
+        state["nodes"] += 1
+        
+        if progress is not None and state["nodes"] % PROGRESS_INTERVAL == 0:
+            progress["nodes"] = state["nodes"]
+            progress["bytes"] = parser.CurrentByteIndex
+    
+    parser.XmlDeclHandler = on_xml_decl
+    parser.StartElementHandler = on_start
+    parser.EndElementHandler = on_end
+    parser.CharacterDataHandler = on_text
+    parser.StartCdataSectionHandler = on_text
+    parser.CommentHandler = on_text
+    parser.ProcessingInstructionHandler = on_text
+    parser.Parse(source, True)
+    
+    if progress is not None:
+        progress["nodes"] = state["nodes"]
+        progress["bytes"] = len(source)
+    
+    return state["name"], vfs_root
+
+VFS_IMAGE_MAGIC = b"KVFSIMG\0"
+VFS_IMAGE_VERSION = 1
+# magic, version, name string, node/string/owner/group counts, blob offset/length,
+# strings offset/length, owners, groups and nodes offsets, checksum
+VFS_IMAGE_HEADER = struct.Struct("<8s6I7QI")
+# parent index, name string, type, flags, owner id, group id, body offset/length
+VFS_IMAGE_NODE = struct.Struct("<IIBBxxIIQQ")
+VFS_IMAGE_NO_PARENT = 0xFFFFFFFF
+VFS_IMAGE_FILE = 1
+VFS_IMAGE_BASE64 = 1
+
+def is_vfs_image(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(VFS_IMAGE_MAGIC)) == VFS_IMAGE_MAGIC
+
+def compile_vfs_image(vfs_name: str, vfs_root: VfsNode, image_path: str) -> int:
+    """Write a VFS tree as a binary image, returns the number of nodes written.
+
+    Layout: header | content blob | string table | owner table | group table |
+    node table. Nodes are stored breadth-first, so a parent always precedes
+    its children, and identical in-memory bodies share one blob range.
+    The header checksum covers the header and every table but not the
+    content blob, so opening an image stays proportional to metadata.
+    """
+    strings = {}
+    owners = {}
+    groups = {}
+    blobs = {}
+    
+    def string_id(value):
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+    
+    def table_id(table, value):
+        if value not in table:
+            table[value] = len(table)
+        return table[value]
+    
+    name_id = string_id(vfs_name)
+    records = []
+    
+    with open(image_path, 'wb') as f:
+        f.write(bytes(VFS_IMAGE_HEADER.size))
+        blob_offset = f.tell()
+        
+        queue = [(vfs_root, VFS_IMAGE_NO_PARENT)]
+        for node, parent in queue:
+            index = len(records)
+            owner = table_id(owners, string_id(node.owner))
+            group = table_id(groups, string_id(node.group))
+            
+            if node.type == "directory":
+                records.append(VFS_IMAGE_NODE.pack(parent, string_id(node.name), 0, 0,
+                                                   owner, group, 0, 0))
+                queue.extend((child, index) for child in node.children.values())
+                continue
+            
+            body = read_file_body(node)
+            if isinstance(body, str):
+                # Bodies shared through the content store are written once
+                location = blobs.get(body)
+                if location is None:
+                    encoded = body.encode('utf-8')
+                    location = blobs[body] = (f.tell() - blob_offset, len(encoded))
+                    f.write(encoded)
+            else:
+                location = (f.tell() - blob_offset, len(body))
+                f.write(body)
+            
+            flags = VFS_IMAGE_BASE64 if node.encoding == "base64" else 0
+            records.append(VFS_IMAGE_NODE.pack(parent, string_id(node.name), VFS_IMAGE_FILE, flags,
+                                               owner, group, *location))
+        
+        blob_length = f.tell() - blob_offset
+        
+        # Names cannot contain NUL in XML, so the table is a single joined string
+        string_table = "\0".join(strings).encode('utf-8')
+        owner_table = struct.pack(f"<{len(owners)}I", *owners)
+        group_table = struct.pack(f"<{len(groups)}I", *groups)
+        node_table = b"".join(records)
+        
+        strings_offset = f.tell()
+        owners_offset = strings_offset + len(string_table)
+        groups_offset = owners_offset + len(owner_table)
+        nodes_offset = groups_offset + len(group_table)
+        
+        fields = (VFS_IMAGE_MAGIC, VFS_IMAGE_VERSION, name_id, len(records), len(strings),
+                  len(owners), len(groups), blob_offset, blob_length, strings_offset,
+                  len(string_table), owners_offset, groups_offset, nodes_offset)
+        checksum = zlib.crc32(VFS_IMAGE_HEADER.pack(*fields, 0))
+        for table in (string_table, owner_table, group_table, node_table):
+            checksum = zlib.crc32(table, checksum)
+            f.write(table)
+        
+        f.seek(0)
+        f.write(VFS_IMAGE_HEADER.pack(*fields, checksum))
+    
+    return len(records)
+
+def parse_vfs_image(image_path: str, progress: dict = None):
+    """Open a compiled VFS image by mmap; file bodies stay in the mapping.
+
+    Returns a (vfs_name, root_node) pair like parse_vfs_stream().
+    Raises ValueError for truncated, corrupt or unsupported images.
+    """
+    with open(image_path, 'rb') as f:
+        source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    if len(source) < VFS_IMAGE_HEADER.size:
+        raise ValueError("truncated VFS image")
+    
+    (magic, version, name_id, node_count, string_count, owner_count, group_count,
+     blob_offset, blob_length, strings_offset, strings_length, owners_offset,
+     groups_offset, nodes_offset, checksum) = VFS_IMAGE_HEADER.unpack_from(source)
+    
+    if magic != VFS_IMAGE_MAGIC:
+        raise ValueError("not a VFS image")
+    if version != VFS_IMAGE_VERSION:
+        raise ValueError(f"unsupported VFS image version {version}")
+    
+    nodes_end = nodes_offset + node_count * VFS_IMAGE_NODE.size
+    if nodes_end != len(source) or blob_offset + blob_length > strings_offset:
+        raise ValueError("truncated VFS image")
+    
+    view = memoryview(source)
+    expected = zlib.crc32(view[:VFS_IMAGE_HEADER.size - 4].tobytes() + bytes(4))
+    expected = zlib.crc32(view[strings_offset:nodes_end], expected)
+    if expected != checksum:
+        raise ValueError("VFS image checksum mismatch")
+    
+    strings = str(view[strings_offset:strings_offset + strings_length], 'utf-8').split("\0")
+    owners = struct.unpack_from(f"<{owner_count}I", source, owners_offset)
+    groups = struct.unpack_from(f"<{group_count}I", source, groups_offset)
+    if len(strings) != string_count:
+        raise ValueError("corrupt VFS image string table")
+    
+    nodes = []
+    for parent, name_index, node_type, flags, owner, group, offset, length in \
+            VFS_IMAGE_NODE.iter_unpack(view[nodes_offset:nodes_end]):
+        name = strings[name_index]
+        owner = strings[owners[owner]]
+        group = strings[groups[group]]
+        
+        if node_type == VFS_IMAGE_FILE:
+            encoding = "base64" if flags & VFS_IMAGE_BASE64 else None
+            node = new_mapped_file_node(name, owner, group, source, blob_offset + offset, length, encoding)
+        else:
+            node = new_directory_node(name, owner, group)
+        
+        if parent != VFS_IMAGE_NO_PARENT:
+            nodes[parent].children[name] = node
+        nodes.append(node)
+        
+        if progress is not None and len(nodes) % PROGRESS_INTERVAL == 0:
+            progress["nodes"] = len(nodes)
+    
+    if not nodes or nodes[0].type != "directory":
+        raise ValueError("VFS image has no root directory")
+    
+    if progress is not None:
+        progress["nodes"] = len(nodes)
+        progress["bytes"] = len(source)
+    
+    return strings[name_id], nodes[0]
+
+START_TAG_PATTERN = re.compile(rb"""<([^\s/>]+)((?:[^>"'/]+|"[^"]*"|'[^']*'|/(?!>))*)(/?)>""")
+ATTRIBUTE_PATTERN = re.compile(rb"""([^\s=]+)\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+ENCODING_PATTERN = re.compile(rb"""<\?xml[^>]*encoding\s*=\s*["']([A-Za-z0-9._-]+)["']""")
+
+def scan_tag_depths(xml_path: str, start: int, end: int):
+    """Worker: track element depth over the tags that begin in [start, end).
+
+    Depth is relative to the start of the range. Returns the net depth change
+    and (relative depth, offset) for every start tag that is not nested
+    inside an element opened earlier in the range: only those can be
+    top-level children once the depth at the range start is known. Relies
+    on the caller having checked that the body has no comments, CDATA or
+    PIs, so every '<' opens a tag.
+    """
+    depth = 0
+    lowest = 0
+    candidates = []
+    
+    with open(xml_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+            i = source.find(b"<", start, end)
+            while i >= 0:
+                if source[i + 1] == 0x2F:
+                    depth -= 1
+                    lowest = min(lowest, depth)
+                    i = source.find(b"<", i + 2, end)
+                    continue
+                
+                tag = START_TAG_PATTERN.match(source, i)
+                if tag is None:
+                    raise ValueError(f"malformed tag at byte {i}")
+                
+                if depth <= lowest:
+                    candidates.append((depth, i))
+                if tag.start(3) == tag.end(3):
+                    depth += 1
+                i = source.find(b"<", tag.end(), end)
+    
+    return depth, candidates
+
+def read_chunk_document(xml_path: str, encoding: str, start: int, end: int):
+    """Wrap a run of top-level siblings into a standalone document."""
+    with open(xml_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    
+    declaration = f'<?xml version="1.0" encoding="{encoding}"?>'.encode('ascii') if encoding else b""
+    return io.BytesIO(declaration + b"<vfs>" + data + b"</vfs>")
+
+def parse_vfs_chunk(xml_path: str, encoding: str, start: int, end: int) -> dict:
+    """Worker: parse a run of top-level siblings, return the children of the VFS root."""
+    _, chunk_root = parse_vfs_file(read_chunk_document(xml_path, encoding, start, end),
+                                   new_content_store())
+    return chunk_root.children
+
+def parse_vfs_parallel(xml_path: str, store: dict, workers: int, progress: dict = None):
+    """Parse top-level subtrees in a process pool and merge them into one tree.
+
+    Two parallel passes: workers first scan byte ranges for tag depths to find
+    where the top-level children start, then parse groups of consecutive
+    top-level siblings. Results are merged in document order, so duplicate
+    names resolve as in parse_vfs_stream(), and bodies are re-interned in
+    store so dedup works across chunks. Documents with comments, CDATA,
+    PIs or a DOCTYPE inside the root, or with a single top-level child,
+    are parsed serially. Returns a (vfs_name, root_node) pair.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    with open(xml_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+            match = ENCODING_PATTERN.match(source)
+            encoding = match.group(1).decode('ascii') if match else None
+            
+            # Skip the prolog (declaration, comments, DOCTYPE) to reach the root tag
+            i = source.find(b"<")
+            while 0 <= i and source[i + 1] in b"?!":
+                i = source.find(b"<", i + 1)
+            root_tag = START_TAG_PATTERN.match(source, i) if i >= 0 else None
+            body_end = source.rfind(b"</")
+            
+            if (root_tag is None or root_tag.end(3) > root_tag.start(3) or body_end < root_tag.end()
+                    or source.find(b"<!", root_tag.end(), body_end) >= 0
+                    or source.find(b"<?", root_tag.end(), body_end) >= 0):
+                return parse_vfs_stream(xml_path, store, progress)
+            
+            body_start = root_tag.end()
+            root_attrs = source[root_tag.start(2):root_tag.end(2)]
+    
+    vfs_name = "vfs"
+    for attr in ATTRIBUTE_PATTERN.finditer(root_attrs):
+        if attr.group(1) == b"name":
+            vfs_name = (attr.group(2) or attr.group(3)).decode('utf-8')
+    
+    vfs_root = new_directory_node("/", USER, "users")
+    pieces = workers * 4
+    step = max(1, (body_end - body_start) // pieces)
+    bounds = list(range(body_start, body_end, step)) + [body_end]
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        scans = pool.map(scan_tag_depths, [xml_path] * (len(bounds) - 1), bounds[:-1], bounds[1:])
+        
+        starts = []
+        base = 1
+        for delta, candidates in scans:
+            starts.extend(offset for depth, offset in candidates if base + depth == 1)
+            base += delta
+        
+        if len(starts) < 2:
+            return parse_vfs_stream(xml_path, store, progress)
+        
+        # Group siblings into roughly equal byte ranges, several per worker
+        target = max(1, (body_end - starts[0]) // pieces)
+        starts.append(body_end)
+        ranges = []
+        first = 0
+        for i in range(1, len(starts)):
+            if starts[i] - starts[first] >= target or i == len(starts) - 1:
+                ranges.append((starts[first], starts[i]))
+                first = i
+        
+        futures = [pool.submit(parse_vfs_chunk, xml_path, encoding, lo, hi) for lo, hi in ranges]
+        nodes = 0
+        for future, (lo, hi) in zip(futures, ranges):
+            try:
+                children = future.result()
+            except RecursionError:
+                # Subtrees deeper than pickle can handle are parsed here instead
+                children = parse_vfs_file(read_chunk_document(xml_path, encoding, lo, hi),
+                                          new_content_store())[1].children
+            
+            vfs_root.children.update(children)
+            queue = list(children.values())
+            for node in queue:
+                if node.type == "directory":
+                    queue.extend(node.children.values())
+                else:
+                    node.data = acquire_content(store, node.data)
+            
+            nodes += len(queue)
+            if progress is not None:
+                progress["nodes"] = nodes
+                progress["bytes"] = hi
+    
+    if progress is not None:
+        progress["bytes"] = os.path.getsize(xml_path)
+    
+    return vfs_name, vfs_root
+
+def set_profiling(enabled: bool):
+    """Turn profiling on or off.
+    
+    tracemalloc runs only while profiling is on, so commands can report the
+    memory they allocate; its overhead is then part of the timings too.
+    """
+    import tracemalloc
+    profile["enabled"] = enabled
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def record_timing(name: str, seconds: float, alloc_bytes: int = 0):
+    """Add one sample to the histogram of name."""
+    entry = profile["timings"].get(name)
+    if entry is None:
+        entry = profile["timings"][name] = {"count": 0, "total": 0.0, "alloc_bytes": 0,
+                                            "buckets": [0] * PROFILE_BUCKETS}
+    
+    micros = seconds * 1e6
+    bucket = int(math.log2(micros) * PROFILE_BUCKETS_PER_OCTAVE) if micros > 1 else 0
+    entry["buckets"][min(bucket, PROFILE_BUCKETS - 1)] += 1
+    entry["count"] += 1
+    entry["total"] += seconds
+    entry["alloc_bytes"] += alloc_bytes
+
+def timing_percentile(entry: dict, fraction: float) -> float:
+    """Upper bound in milliseconds of the bucket holding the given fraction of samples."""
+    rank = max(1, math.ceil(entry["count"] * fraction))
+    seen = 0
+    for bucket, count in enumerate(entry["buckets"]):
+        seen += count
+        if seen >= rank:
+            return 2 ** ((bucket + 1) / PROFILE_BUCKETS_PER_OCTAVE) / 1000
+    return 0.0
+
+def timing_summary() -> dict:
+    return {
+        name: {
+            "count": entry["count"],
+            "mean_ms": round(entry["total"] * 1000 / entry["count"], 4),
+            "p50_ms": round(timing_percentile(entry, 0.50), 4),
+            "p95_ms": round(timing_percentile(entry, 0.95), 4),
+            "p99_ms": round(timing_percentile(entry, 0.99), 4),
+            "peak_alloc_kib_per_call": round(entry["alloc_bytes"] / entry["count"] / 1024, 1)
+        }
+        for name, entry in sorted(profile["timings"].items())
+    }
+
+def dump_profile_json():
+    import json
+    path = config['profile_json']
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(timing_summary(), f, indent=2)
+    except OSError as e:
+        print(f"stats: cannot write {path}: {e}", file=sys.__stderr__)
+
+def read_vfs(path: str, mmap_content: bool = False, progress: dict = None):
+    """Parse a VFS XML file or compiled image without touching the live VFS.
+
+    Returns (vfs_name, root_node, content_store, owner_index) for
+    install_vfs().
+    """
+    store = new_content_store()
+    workers = config['load_workers']
+    start = time.perf_counter()
+    
+    if is_vfs_image(path):
+        vfs_name, vfs_root = parse_vfs_image(path, progress)
+    elif mmap_content:
+        vfs_name, vfs_root = parse_vfs_mapped(path, store, progress)
+    elif workers > 1 and os.path.getsize(path) >= PARALLEL_LOAD_MIN_BYTES:
+        vfs_name, vfs_root = parse_vfs_parallel(path, store, workers, progress)
+    else:
+        vfs_name, vfs_root = parse_vfs_stream(path, store, progress)
+    
+    parsed = time.perf_counter()
+    owners = build_owner_index(vfs_root)
+    
+    if profile["enabled"]:
+        record_timing("load:parse", parsed - start)
+        record_timing("load:index", time.perf_counter() - parsed)
+    
+    return vfs_name, vfs_root, store, owners
+
+def install_vfs(vfs_name: str, vfs_root: VfsNode, store: dict, owners: dict):
+    # The old tree and its store are dropped together, releasing every blob
+    vfs["name"] = vfs_name
+    vfs["root"] = vfs_root
+    vfs["store"] = store
+    vfs["owners"] = owners
+    vfs["sizes"] = None
+    vfs["generation"] += 1
+    vfs["overlay"] = {}
+    vfs["grep_index"] = None
+    decoded_cache.clear()
+    vfs["current_dir"] = "/"
+    resolve_path.cache_clear()
+
+def report_load_error(path: str, error: Exception):
+    import xml.etree.ElementTree as ET
+    import xml.parsers.expat as expat
+    if isinstance(error, FileNotFoundError):
+        print(f"ERROR: VFS file not found: {path}")
+    elif isinstance(error, (ET.ParseError, expat.ExpatError)):
+        print(f"ERROR: Invalid XML format: {error}")
+    else:
+        print(f"ERROR: Failed to load VFS: {error}")
+
+def load_vfs_from_xml(xml_path: str, mmap_content: bool = False) -> bool:
+    try:
+        install_vfs(*read_vfs(xml_path, mmap_content))
+    except Exception as e:
+        report_load_error(xml_path, e)
         return False
+    
+    print(f"VFS '{vfs['name']}' loaded successfully from {xml_path}")
+    return True
+
+def run_background_load():
+    state = background_load
+    try:
+        state["result"] = read_vfs(state["path"], state["mmap_content"], state["progress"])
     except Exception as e:
-        print(f"ERROR: Failed to load VFS: {e}")
+        state["error"] = e
+
+def start_background_load(path: str, mmap_content: bool) -> bool:
+    if background_load["thread"] is not None:
+        print(f"vfs-load: a background load of {background_load['path']} is already running")
         return False
+    
+    try:
+        total = os.path.getsize(path)
+    except OSError as e:
+        report_load_error(path, e)
+        return False
+    
+    background_load.update({
+        "path": path,
+        "mmap_content": mmap_content,
+        "progress": {"bytes": 0, "total": total, "nodes": 0},
+        "result": None,
+        "error": None,
+        "generation": vfs["generation"],
+        "session": current_session
+    })
+    thread = threading.Thread(target=run_background_load, name="vfs-load", daemon=True)
+    background_load["thread"] = thread
+    thread.start()
+    return True
 
-def normalize_path(path: str) -> str:
-    if path.startswith("/"):
-        return path.replace("\\", "/")
+def finish_background_load() -> bool:
+    """Swap in a finished background load; called by the main thread between commands.
+
+    Returns True when a VFS was installed.
+    """
+    thread = background_load["thread"]
+    if thread is None or thread.is_alive():
+        return False
     
-    if vfs["current_dir"] == "/":
-        result = "/" + path
-    else:
-        result = vfs["current_dir"] + "/" + path
+    thread.join()
+    background_load["thread"] = None
+    path = background_load["path"]
+    
+    if background_load["error"] is not None:
+        report_load_error(path, background_load["error"])
+        print("Background VFS load failed. Current VFS left unchanged.")
+        background_load["error"] = None
+        return False
+    
+    if background_load["generation"] != vfs["generation"]:
+        background_load["result"] = None
+        print(f"Background load of {path} discarded: another VFS was loaded while it ran.")
+        return False
+    
+    install_vfs(*background_load["result"])
+    background_load["result"] = None
+    config['vfs_path'] = path
+    print(f"VFS '{vfs['name']}' loaded successfully from {path}")
+    print("VFS loaded successfully. Current directory reset to root.")
+    return True
+
+@lru_cache(maxsize=PATH_CACHE_SIZE)
+def resolve_path(current_dir: str, path: str) -> str:
+    """Absolute form of path with '.', '..' and empty components resolved.
+
+    Absolute and relative paths go through the same resolution. Memoized on
+    (current_dir, path); the cache is cleared on cd and vfs-load.
+    """
+    result = path.replace("\\", "/")
+    if not result.startswith("/"):
+        result = current_dir + "/" + result
     
     parts = []
     for part in result.split("/"):
@@ -106,112 +1169,814 @@ def normalize_path(path: str) -> str:
     
     return "/" + "/".join(parts) if parts else "/"
 
-def get_file_content(path: str) -> str:
-    normalized = normalize_path(path)
+def normalize_path(path: str) -> str:
+    return resolve_path(vfs["current_dir"], path)
+
+def find_node(normalized: str):
+    """Walk the directory tree from the root; cost is O(path depth).
+
+    The session's overlay version of the node is returned when it has one.
+    """
+    node = vfs["root"]
+    
+    for part in normalized.split("/"):
+        if not part:
+            continue
+        children = node.children
+        if children is None or part not in children:
+            return None
+        node = children[part]
+    
+    return vfs["overlay"].get(normalized, node) if vfs["overlay"] else node
+
+def read_file_body(node: VfsNode):
+    """Raw stored body: a str, or a zero-copy memoryview for mmap-backed nodes."""
+    if not node.flags & NODE_MAPPED:
+        return node.data
+    
+    return memoryview(node.data)[node.offset:node.offset + node.length]
+
+def decode_file_content(node: VfsNode):
+    """Return the text of a file node, decoding base64 bodies on first access.
+
+    Plain mmap-backed bodies are returned as memoryview slices of UTF-8 bytes.
+    Raises ValueError when the stored body is not valid base64/UTF-8.
+    """
+    if not node.flags & NODE_BASE64:
+        return read_file_body(node)
+    
+    key = id(node)
+    cached = decoded_cache.get(key)
+    if cached is not None:
+        decoded_cache.move_to_end(key)
+        return cached[1]
+    
+    start = time.perf_counter()
+    
+    # XML bodies are often wrapped or indented; only whitespace is tolerated
+    raw = read_file_body(node)
+    if isinstance(raw, memoryview):
+        encoded = b"".join(raw.tobytes().split())
+    else:
+        encoded = "".join(raw.split())
+    import base64
+    try:
+        content = base64.b64decode(encoded, validate=True).decode('utf-8')
+    except binascii.Error as e:
+        raise ValueError(f"invalid base64 content: {e}")
+    except UnicodeDecodeError:
+        raise ValueError("base64 content is not valid UTF-8")
+    
+    if profile["enabled"]:
+        record_timing("decode", time.perf_counter() - start)
+    
+    limit = config["content_cache_size"]
+    if limit > 0:
+        decoded_cache[key] = (node, content)
+        while len(decoded_cache) > limit:
+            decoded_cache.popitem(last=False)
+    
+    return content
+
+def iter_base64_text(raw, chunk_size: int):
+    """Decode a base64 body piece by piece; one "decode" sample per body."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = raw[:0] if isinstance(raw, str) else b""
+    # Time spent decoding, not in the consumer between pieces
+    elapsed = 0.0
+    
+    for i in range(0, len(raw), chunk_size):
+        start = time.perf_counter()
+        piece = raw[i:i + chunk_size]
+        if isinstance(piece, memoryview):
+            piece = b"".join(piece.tobytes().split())
+        else:
+            piece = "".join(piece.split())
+        
+        # Decode whole quanta only; the remainder waits for the next piece
+        piece = pending + piece
+        usable = len(piece) - len(piece) % 4
+        pending = piece[usable:]
+        text = decode_base64_piece(decoder, piece[:usable])
+        elapsed += time.perf_counter() - start
+        yield text
+    
+    start = time.perf_counter()
+    text = decode_base64_piece(decoder, pending, final=True)
+    if profile["enabled"]:
+        record_timing("decode", elapsed + time.perf_counter() - start)
+    yield text
+
+def decode_base64_piece(decoder, piece, final: bool = False) -> str:
+    import base64
+    try:
+        return decoder.decode(base64.b64decode(piece, validate=True), final)
+    except binascii.Error as e:
+        raise ValueError(f"invalid base64 content: {e}")
+    except UnicodeDecodeError:
+        raise ValueError("base64 content is not valid UTF-8")
+
+def iter_file_text(node: VfsNode, chunk_size: int = TEXT_CHUNK_SIZE):
+    """Yield the text of a file node in pieces of about chunk_size characters.
+
+    base64 bodies up to DECODED_CACHE_MAX_BODY go through the decoded_cache
+    of decode_file_content(); longer ones, and all of them when the cache is
+    off, are decoded piece by piece so extra memory stays constant.
+    Raises ValueError for undecodable bodies.
+    """
+    raw = read_file_body(node)
+    
+    if node.flags & NODE_BASE64:
+        if config["content_cache_size"] <= 0 or len(raw) > DECODED_CACHE_MAX_BODY:
+            yield from iter_base64_text(raw, chunk_size)
+            return
+        raw = decode_file_content(node)
+    
+    if isinstance(raw, str):
+        for i in range(0, len(raw), chunk_size):
+            yield raw[i:i + chunk_size]
+        return
+    
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        for i in range(0, len(raw), chunk_size):
+            yield decoder.decode(raw[i:i + chunk_size])
+        yield decoder.decode(b"", True)
+    except UnicodeDecodeError:
+        raise ValueError("content is not valid UTF-8")
+
+def list_directory(path: str) -> list:
+    node = find_node(normalize_path(path))
+    
+    if node is None:
+        return None
+    
+    return sorted(node.children or ())
+
+def change_directory(path: str) -> bool:
+    new_path = normalize_path(path)
+    node = find_node(new_path)
+    
+    if node is not None and node.type == "directory":
+        vfs["current_dir"] = new_path
+        resolve_path.cache_clear()
+        return True
+    
+    return False
+
+def count_text(chunks) -> tuple:
+    """Line/word/char count over text pieces in constant extra memory.
+
+    Same results as the newline count (+1 for a last line without a
+    newline), len(content.split()) and len(content) on the joined text.
+    Words are whitespace-to-non-whitespace transitions in a byte map of
+    each piece (see WORD_CLASS_TABLE), so no word list is built; a word
+    split across two pieces is counted once.
+    """
+    lines = words = chars = 0
+    in_word = False
+    last = ""
+    
+    for chunk in chunks:
+        if not chunk:
+            continue
+        
+        lines += chunk.count('\n')
+        chars += len(chunk)
+        if chunk.isascii():
+            data = chunk.encode('ascii')
+        else:
+            data = NON_ASCII_SPACE.sub(" ", chunk).encode('utf-8', 'surrogatepass')
+        classes = data.translate(WORD_CLASS_TABLE)
+        words += classes.count(b" x")
+        if not in_word and classes[0] == 0x78:
+            words += 1
+        
+        in_word = not chunk[-1].isspace()
+        last = chunk[-1]
+    
+    if chars and last != '\n':
+        lines += 1
+    
+    return lines, words, chars
+
+def parse_short_flags(args: list, allowed: str) -> tuple:
+    """Split args into (flags, operands) for commands with single-letter options.
+    
+    Options may be grouped (-lw) and "--" ends them; "-" alone is an operand.
+    Raises ValueError naming the first option that is not in allowed.
+    """
+    flags = ""
+    operands = []
+    
+    for i, arg in enumerate(args):
+        if arg == "--":
+            operands.extend(args[i + 1:])
+            break
+        if arg.startswith("-") and len(arg) > 1:
+            for flag in arg[1:]:
+                if flag not in allowed:
+                    raise ValueError(f"invalid option -- '{flag}'")
+                flags += flag
+        else:
+            operands.append(arg)
+    
+    return flags, operands
+
+def command_wc(args: list) -> bool:
+    try:
+        selected, files = parse_short_flags(args, "lwc")
+    except ValueError as e:
+        print(f"wc: {e}")
+        print("Usage: wc [-l] [-w] [-c] FILE...")
+        return False
+    
+    if not files:
+        print("wc: missing file operand")
+        return False
+    
+    # Output keeps the l, w, c column order whatever order the flags came in
+    columns = [i for i, flag in enumerate("lwc") if not selected or flag in selected]
+    totals = [0, 0, 0]
+    success = True
+    
+    for file_path in files:
+        node = find_node(normalize_path(file_path))
+        if node is None or node.type != "file":
+            print(f"wc: {file_path}: No such file or directory")
+            success = False
+            continue
+        
+        try:
+            counts = count_text(iter_file_text(node))
+        except ValueError as e:
+            print(f"wc: {file_path}: {e}")
+            success = False
+            continue
+        
+        for i in range(3):
+            totals[i] += counts[i]
+        print("  " + "  ".join(str(counts[i]) for i in columns) + f" {file_path}")
+    
+    if len(files) > 1:
+        print("  " + "  ".join(str(totals[i]) for i in columns) + " total")
+    
+    return success
+
+def line_trigrams(line: str) -> set:
+    return {line[i:i + 3] for i in range(len(line) - 2)}
+
+def index_trigrams(line: str):
+    for gram in line_trigrams(line):
+        history_index["trigrams"].setdefault(gram, set()).add(line)
+
+def add_history_entry(line: str):
+    number = history_index["next"]
+    history_index["next"] += 1
+    command_history.append((number, line))
+    
+    numbers = history_index["lines"].get(line)
+    if numbers is None:
+        numbers = history_index["lines"][line] = deque()
+        if history_index["trigrams"] is not None:
+            index_trigrams(line)
+    numbers.append(number)
+    
+    while len(command_history) > config['history_size']:
+        old_number, old_line = command_history.popleft()
+        numbers = history_index["lines"][old_line]
+        numbers.popleft()
+        if not numbers:
+            del history_index["lines"][old_line]
+            if history_index["trigrams"] is None:
+                continue
+            for gram in line_trigrams(old_line):
+                lines = history_index["trigrams"][gram]
+                lines.discard(old_line)
+                if not lines:
+                    del history_index["trigrams"][gram]
+
+def read_last_lines(path: str, count: int) -> list:
+    """The last count lines of a text file, read backwards in blocks."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        blocks = []
+        newlines = 0
+        while pos > 0 and newlines <= count:
+            size = min(TEXT_CHUNK_SIZE, pos)
+            pos -= size
+            f.seek(pos)
+            block = f.read(size)
+            newlines += block.count(b"\n")
+            blocks.append(block)
+    
+    lines = b"".join(reversed(blocks)).decode("utf-8", errors="replace").splitlines()
+    return lines[-count:] if count else []
+
+def load_history():
+    """Fill command_history from the history file on first use.
+
+    Lines entered before that are already in the file, so they are not kept
+    in memory until then.
+    """
+    if history_index["loaded"]:
+        return
+    history_index["loaded"] = True
+    
+    path = config['history_file']
+    if not path:
+        return
+    
+    try:
+        lines = read_last_lines(path, config['history_size'])
+    except FileNotFoundError:
+        return
+    except OSError as e:
+        print(f"history: cannot read {path}: {e}")
+        return
+    
+    for line in lines:
+        if line:
+            add_history_entry(line)
+
+def record_history(line: str):
+    path = config['history_file']
+    if path:
+        try:
+            if history_index["file"] is None:
+                history_index["file"] = open(path, "a", encoding="utf-8", buffering=1)
+            history_index["file"].write(line + "\n")
+        except OSError as e:
+            print(f"history: cannot write {path}: {e}")
+            load_history()
+            config['history_file'] = None
+    
+    if history_index["loaded"] or not config['history_file']:
+        history_index["loaded"] = True
+        add_history_entry(line)
+
+def clear_history():
+    command_history.clear()
+    history_index["lines"].clear()
+    history_index["trigrams"] = None
+    history_index["loaded"] = True
+    
+    path = config['history_file']
+    if path:
+        try:
+            if history_index["file"] is not None:
+                history_index["file"].close()
+                history_index["file"] = None
+            open(path, "w").close()
+        except OSError as e:
+            print(f"history: cannot clear {path}: {e}")
+
+def search_history(text: str, prefix: bool) -> list:
+    """(number, line) entries containing text, or starting with it when prefix.
+
+    Candidate lines come from intersecting the trigram sets of text; only
+    texts shorter than three characters scan the distinct lines.
+    """
+    if history_index["trigrams"] is None:
+        history_index["trigrams"] = {}
+        for line in history_index["lines"]:
+            index_trigrams(line)
+    
+    grams = line_trigrams(text)
+    if grams:
+        sets = sorted((history_index["trigrams"].get(gram, set()) for gram in grams), key=len)
+        candidates = sets[0].intersection(*sets[1:])
+    else:
+        candidates = history_index["lines"]
+    
+    matches = []
+    for line in candidates:
+        if line.startswith(text) if prefix else text in line:
+            matches.extend((number, line) for number in history_index["lines"][line])
+    
+    return sorted(matches)
+
+def show_command_history(args: list) -> bool:
+    usage = "Usage: history [N] | history -c | history -s TEXT | history -p PREFIX"
+    load_history()
+    entries = command_history
+    
+    if args:
+        if args[0] == "-c":
+            clear_history()
+            return True
+        elif args[0] in ("-s", "-p"):
+            if len(args) < 2:
+                print(f"history: {args[0]}: option requires an argument")
+                print(usage)
+                return False
+            entries = search_history(args[1], args[0] == "-p")
+        elif args[0].isdigit():
+            count = int(args[0])
+            entries = list(command_history)[-count:] if count else []
+        else:
+            print(f"history: {args[0]}: numeric argument required")
+            print(usage)
+            return False
+    
+    if not command_history:
+        print("History is empty")
+        return True
+    
+    for idx, cmd in entries:
+        print(f"  {idx}  {cmd}")
+    
+    return True
+
+def command_chown(args: list) -> bool:
+    usage = "Usage: chown [-R] [--from=OWNER[:GROUP]] [OWNER][:GROUP] FILE"
+    recursive = False
+    from_spec = None
+    while args and args[0].startswith("-"):
+        if args[0] == "-R":
+            recursive = True
+        elif args[0].startswith("--from="):
+            from_spec = args[0][len("--from="):]
+        else:
+            print(f"chown: invalid option '{args[0]}'")
+            print(usage)
+            return False
+        args = args[1:]
+    
+    if len(args) < 2:
+        print("chown: missing operand")
+        print(usage)
+        return False
+    
+    owner_spec = args[0]
+    file_path = args[1]
+    
+    if ":" in owner_spec:
+        owner, group = owner_spec.split(":", 1)
+    else:
+        owner = owner_spec
+        group = None
+    
+    path = normalize_path(file_path)
+    node = find_node(path)
+    
+    if node is None:
+        print(f"chown: cannot access '{file_path}': No such file or directory")
+        return False
+    
+    index, overlay = vfs["owners"], vfs["overlay"]
+    from_owner, _, from_group = (from_spec or "").partition(":")
+    if not recursive:
+        entries = [(path, node)]
+    elif from_owner:
+        # Only nodes with the old owner are touched, so take them from the index
+        entries = indexed_under(index, overlay, "owner", from_owner, path)
+    elif from_group:
+        entries = indexed_under(index, overlay, "group", from_group, path)
+    else:
+        entries = list(walk_subtree(path, node, overlay))
+    
+    if from_owner or from_group:
+        entries = [(p, n) for p, n in entries
+                   if (not from_owner or n.owner == from_owner)
+                   and (not from_group or n.group == from_group)]
+    
+    set_principal(overlay, entries, "owner", owner)
+    if group:
+        set_principal(overlay, entries, "group", group)
+    
+    spec = owner + (f":{group}" if group else "")
+    if recursive:
+        print(f"Changed ownership of {len(entries)} entries under '{file_path}' to {spec}")
+    elif entries:
+        print(f"Changed owner of '{file_path}' to {spec}")
+    
+    return True
+
+def command_find(args: list) -> bool:
+    usage = "Usage: find [PATH] [-user USER] [-group GROUP] [-name PATTERN] [-type f|d]"
+    start = "."
+    if args and not args[0].startswith("-"):
+        start = args[0]
+        args = args[1:]
+    
+    tests = {}
+    while args:
+        if args[0] not in ("-user", "-group", "-name", "-type") or len(args) < 2:
+            print(f"find: unknown predicate or missing argument: '{args[0]}'")
+            print(usage)
+            return False
+        tests[args[0]] = args[1]
+        args = args[2:]
+    
+    node_type = tests.get("-type")
+    if node_type not in (None, "f", "d"):
+        print(f"find: Unknown argument to -type: {node_type}")
+        return False
+    
+    base = normalize_path(start)
+    base_node = find_node(base)
+    if base_node is None:
+        print(f"find: '{start}': No such file or directory")
+        return False
+    
+    # With -user/-group the candidates come from the ownership index instead
+    # of a walk; the other test is checked per node below
+    if "-user" in tests:
+        matches = indexed_under(vfs["owners"], vfs["overlay"], "owner", tests["-user"], base)
+    elif "-group" in tests:
+        matches = indexed_under(vfs["owners"], vfs["overlay"], "group", tests["-group"], base)
+    else:
+        matches = walk_subtree(base, base_node, vfs["overlay"])
+    
+    found = []
+    for path, node in matches:
+        if "-user" in tests and node.owner != tests["-user"]:
+            continue
+        if "-group" in tests and node.group != tests["-group"]:
+            continue
+        if node_type is not None and node_type != ("d" if node.flags & NODE_DIRECTORY else "f"):
+            continue
+        if "-name" in tests and not fnmatch.fnmatchcase(node.name, tests["-name"]):
+            continue
+        found.append(path)
+    
+    # Paths are printed relative to START as it was typed, like find(1)
+    display = start.rstrip("/") or "/"
+    for path in sorted(found):
+        rest = path[len(base):].lstrip("/")
+        if not rest:
+            print(display)
+        else:
+            print(display.rstrip("/") + "/" + rest)
+    
+    return True
+
+def build_grep_index(vfs_root: VfsNode) -> dict:
+    """Trigram index of the casefolded text of every distinct file body.
+
+    "paths" lists the paths sharing each body, "trigrams" maps a trigram to
+    the numbers of the bodies containing it and "unreadable" holds bodies
+    that do not decode, which stay candidates for any pattern. Overlay
+    copies share the body of their base node, so the base tree is enough.
+    """
+    index = {"paths": [], "trigrams": {}, "unreadable": set()}
+    numbers = {}
     
-    if normalized in vfs["files"] and vfs["files"][normalized]["type"] == "file":
-        return vfs["files"][normalized]["content"]
+    for path, node in walk_subtree("/", vfs_root):
+        if node.flags & NODE_DIRECTORY:
+            continue
+        
+        # Deduplicated bodies share one str; mapped bodies are told apart by offset
+        key = (node.flags, node.offset if node.flags & NODE_MAPPED else node.data)
+        number = numbers.get(key)
+        if number is None:
+            number = numbers[key] = len(index["paths"])
+            index["paths"].append([])
+            try:
+                text = "".join(iter_file_text(node)).casefold()
+            except ValueError:
+                index["unreadable"].add(number)
+            else:
+                for gram in line_trigrams(text):
+                    index["trigrams"].setdefault(gram, set()).add(number)
+        index["paths"][number].append(path)
     
-    return None
+    return index
 
-def list_directory(path: str) -> list:
-    items = []
-    path = normalize_path(path)
+def grep_index() -> dict:
+    if vfs["grep_index"] is None:
+        start = time.perf_counter()
+        vfs["grep_index"] = build_grep_index(vfs["root"])
+        if profile["enabled"]:
+            record_timing("grep:index", time.perf_counter() - start)
+    return vfs["grep_index"]
+
+def indexed_grep_candidates(index: dict, literal: str, base: str) -> list:
+    """Paths at or below base whose body contains every trigram of literal."""
+    grams = line_trigrams(literal.casefold())
+    sets = sorted((index["trigrams"].get(gram, set()) for gram in grams), key=len)
+    numbers = sets[0].intersection(*sets[1:]) | index["unreadable"]
     
-    if path != "/" and path not in vfs["files"]:
-        return None
+    prefix = base.rstrip("/") + "/"
+    return [path for number in numbers for path in index["paths"][number]
+            if path == base or path.startswith(prefix)]
+
+def file_paths_under(base: str, node: VfsNode) -> list:
+    return [path for path, child in walk_subtree(base, node, vfs["overlay"])
+            if not child.flags & NODE_DIRECTORY]
+
+def is_literal_pattern(pattern: str) -> bool:
+    return not any(char in GREP_SPECIAL_CHARS for char in pattern)
+
+def grep_matcher(pattern: str, ignore_case: bool):
+    """Predicate telling whether a piece of text has a match of pattern.
+
+    Pieces may hold several lines: ^ and $ match at every line boundary, so
+    a piece matches whenever one of its lines does.
+    """
+    if is_literal_pattern(pattern):
+        if ignore_case:
+            needle = pattern.casefold()
+            return lambda text: needle in text.casefold()
+        return lambda text: pattern in text
+    
+    regex = re.compile(pattern, re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+    return lambda text: regex.search(text) is not None
+
+def grep_node(node: VfsNode, matcher, first_only: bool = False) -> list:
+    """Matching lines of a file node, read in chunks like wc.
+
+    Chunks without a match are skipped without being split into lines.
+    """
+    found = []
+    pending = ""
     
-    for file_path, file_info in vfs["files"].items():
-        if file_path == path:
+    for chunk in iter_file_text(node):
+        block = pending + chunk
+        cut = block.rfind("\n")
+        if cut < 0:
+            pending = block
             continue
-            
-        parent = os.path.dirname(file_path).replace("\\", "/")
-        if parent == path or (path == "/" and "/" not in file_path.lstrip("/")):
-            items.append(file_info["name"])
+        
+        pending = block[cut + 1:]
+        if matcher(block[:cut]):
+            for line in block[:cut].split("\n"):
+                if matcher(line):
+                    found.append(line)
+                    if first_only:
+                        return found
     
-    return sorted(items)
+    if pending and matcher(pending):
+        found.append(pending)
+    return found
 
-def change_directory(path: str) -> bool:
-    new_path = normalize_path(path)
+def grep_paths(paths: list, pattern: str, ignore_case: bool, first_only: bool) -> list:
+    """Grep each path of the current tree; returns (path, lines, error) triples.
+
+    Also the worker of grep_parallel(), which sees the tree as it was when
+    the pool forked.
+    """
+    matcher = grep_matcher(pattern, ignore_case)
+    results = []
     
-    if new_path == "/":
-        vfs["current_dir"] = "/"
-        return True
+    for path in paths:
+        try:
+            results.append((path, grep_node(find_node(path), matcher, first_only), None))
+        except ValueError as e:
+            results.append((path, None, str(e)))
     
-    if new_path in vfs["files"] and vfs["files"][new_path]["type"] == "directory":
-        vfs["current_dir"] = new_path
-        return True
+    return results
+
+def grep_parallel(paths: list, pattern: str, ignore_case: bool, first_only: bool) -> list:
+    """grep_paths() over shards of paths in a pool of forked workers.
+
+    Forked workers inherit the tree, so only paths and results are pickled.
+    Platforms without fork scan serially.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    try:
+        context = multiprocessing.get_context("fork")
+    except ValueError:
+        return grep_paths(paths, pattern, ignore_case, first_only)
     
-    return False
+    workers = config['load_workers']
+    step = -(-len(paths) // (workers * 4))
+    shards = [paths[i:i + step] for i in range(0, len(paths), step)]
+    results = []
+    
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        for part in pool.map(grep_paths, shards, [pattern] * len(shards),
+                             [ignore_case] * len(shards), [first_only] * len(shards)):
+            results.extend(part)
+    
+    return results
 
-def command_wc(args: list) -> bool:
-    if not args:
-        print("wc: missing file operand")
+def command_grep(args: list) -> bool:
+    usage = "Usage: grep [-r] [-i] [-l] [-c] PATTERN PATH..."
+    try:
+        selected, operands = parse_short_flags(args, "rilc")
+    except ValueError as e:
+        print(f"grep: {e}")
+        print(usage)
         return False
     
-    file_path = args[0]
-    content = get_file_content(file_path)
-    
-    if content is None:
-        print(f"wc: {file_path}: No such file or directory")
+    if len(operands) < 2:
+        print("grep: missing pattern or file operand")
+        print(usage)
         return False
     
-    lines = content.count('\n') + (1 if content and not content.endswith('\n') else 0)
-    words = len(content.split())
-    chars = len(content)
+    pattern, targets = operands[0], operands[1:]
+    recursive = "r" in selected
+    ignore_case = "i" in selected
     
-    print(f"  {lines}  {words}  {chars} {file_path}")
-    return True
-
-def show_command_history(args: list) -> bool:
-    if not command_history:
-        print("History is empty")
-        return True
+    try:
+        grep_matcher(pattern, ignore_case)
+    except re.error as e:
+        print(f"grep: invalid pattern '{pattern}': {e}")
+        return False
     
-    for idx, cmd in enumerate(command_history, 1):
-        print(f"  {idx}  {cmd}")
+    # Literal patterns with a trigram prune recursive searches through the index
+    use_index = (config['grep_index'] and is_literal_pattern(pattern)
+                 and len(pattern) >= 3)
     
-    return True
-
-def command_chown(args: list) -> bool:
-    if len(args) < 2:
-        print("chown: missing operand")
-        print("Usage: chown [OWNER][:GROUP] FILE")
-        return False
+    # (absolute path, path as displayed) of every file to report, in output
+    # order; files in pruned are known from the index not to match
+    files = []
+    pruned = set()
+    success = True
     
-    owner_spec = args[0]
-    file_path = args[1]
+    for target in targets:
+        base = normalize_path(target)
+        node = find_node(base)
+        if node is None:
+            print(f"grep: {target}: No such file or directory")
+            success = False
+            continue
+        if not node.flags & NODE_DIRECTORY:
+            files.append((base, target))
+            continue
+        if not recursive:
+            print(f"grep: {target}: Is a directory")
+            success = False
+            continue
+        
+        if use_index:
+            paths = indexed_grep_candidates(grep_index(), pattern, base)
+            if "c" in selected:
+                # -c reports files without matches too; they just need no scan
+                matched = set(paths)
+                paths = file_paths_under(base, node)
+                pruned.update(path for path in paths if path not in matched)
+        else:
+            paths = file_paths_under(base, node)
+        
+        # Paths are shown relative to the operand as it was typed, like find
+        display = target.rstrip("/")
+        for path in sorted(paths):
+            files.append((path, display + path[len(base.rstrip("/")):]))
     
-    if ":" in owner_spec:
-        owner, group = owner_spec.split(":", 1)
+    first_only = "l" in selected
+    paths = [path for path, _ in files if path not in pruned]
+    if config['load_workers'] > 1 and len(paths) >= GREP_PARALLEL_MIN_FILES:
+        results = grep_parallel(paths, pattern, ignore_case, first_only)
     else:
-        owner = owner_spec
-        group = None
+        results = grep_paths(paths, pattern, ignore_case, first_only)
+    found = {path: (lines, error) for path, lines, error in results}
     
-    normalized_path = normalize_path(file_path)
+    show_names = recursive or len(targets) > 1
+    for path, display in files:
+        lines, error = found.get(path, ([], None))
+        if error is not None:
+            print(f"grep: {display}: {error}")
+            success = False
+        elif "l" in selected:
+            if lines:
+                print(display)
+        elif "c" in selected:
+            print(f"{display}:{len(lines)}" if show_names else str(len(lines)))
+        else:
+            for line in lines:
+                print(f"{display}:{line}" if show_names else line)
     
-    if normalized_path not in vfs["files"]:
-        print(f"chown: cannot access '{file_path}': No such file or directory")
+    return success
+
+def command_vfs_load(args: list) -> bool:
+    if not args:
+        print("vfs-load: missing file operand")
+        print("Usage: vfs-load [--mmap] [--async] <path_to_vfs.xml|image>")
+        print("       vfs-load --status")
         return False
     
-    vfs["files"][normalized_path]["owner"] = owner
-    if group:
-        vfs["files"][normalized_path]["group"] = group
+    if args[0] == "--status":
+        return show_background_load_status()
     
-    print(f"Changed owner of '{file_path}' to {owner}" + (f":{group}" if group else ""))
+    mmap_content = config['mmap_content']
+    # A server loads in the background so other sessions keep working meanwhile
+    run_async = bool(config['serve'])
+    while args and args[0] in ("--mmap", "--async"):
+        if args[0] == "--mmap":
+            mmap_content = True
+        else:
+            run_async = True
+        args = args[1:]
     
-    return True
-
-def command_vfs_load(args: list) -> bool:
     if not args:
         print("vfs-load: missing file operand")
-        print("Usage: vfs-load <path_to_vfs.xml>")
         return False
     
     vfs_path = args[0]
     
+    if run_async:
+        if not start_background_load(vfs_path, mmap_content):
+            return False
+        print(f"Loading new VFS from: {vfs_path} in the background (see 'vfs-load --status')")
+        return True
+    
     print(f"Loading new VFS from: {vfs_path}")
-    success = load_vfs_from_xml(vfs_path)
+    success = load_vfs_from_xml(vfs_path, mmap_content)
     
     if success:
         config['vfs_path'] = vfs_path
@@ -219,6 +1984,144 @@ def command_vfs_load(args: list) -> bool:
     
     return success
 
+def show_background_load_status() -> bool:
+    progress = background_load["progress"]
+    if progress is None:
+        print("vfs-load: no background load has been started")
+        return True
+    
+    if background_load["thread"] is not None:
+        state = "loading"
+    else:
+        state = "finished"
+    
+    print(f"vfs-load: {state} {background_load['path']}: "
+          f"{progress['bytes']} of {progress['total']} bytes read, {progress['nodes']} nodes parsed")
+    return True
+
+def command_vfs_compile(args: list) -> bool:
+    import xml.etree.ElementTree as ET
+    xml_path, image_path = args[0], args[1]
+    
+    try:
+        vfs_name, vfs_root = parse_vfs_stream(xml_path, new_content_store())
+        count = compile_vfs_image(vfs_name, vfs_root, image_path)
+    except FileNotFoundError:
+        print(f"vfs-compile: {xml_path}: No such file or directory")
+        return False
+    except ET.ParseError as e:
+        print(f"vfs-compile: Invalid XML format: {e}")
+        return False
+    except Exception as e:
+        print(f"vfs-compile: {e}")
+        return False
+    
+    print(f"Compiled VFS '{vfs_name}' ({count} nodes) to {image_path}")
+    return True
+
+def command_stats(args: list) -> bool:
+    import json
+    action = args[0] if args else "show"
+    
+    if action in ("on", "off"):
+        set_profiling(action == "on")
+        print(f"stats: profiling {'enabled' if profile['enabled'] else 'disabled'}")
+        return True
+    elif action == "reset":
+        profile["timings"].clear()
+        return True
+    elif action == "json":
+        print(json.dumps(timing_summary(), indent=2))
+        return True
+    elif action != "show":
+        print(f"stats: unknown action '{action}'")
+        print("Usage: stats [on|off|reset|json]")
+        return False
+    
+    summary = timing_summary()
+    if not summary:
+        state = "on" if profile["enabled"] else "off (enable with 'stats on' or --profile)"
+        print(f"stats: no samples recorded; profiling is {state}")
+        return True
+    
+    print(f"{'command':<16} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'peak KiB/call':>14}")
+    for name, row in summary.items():
+        print(f"{name:<16} {row['count']:>7} {row['p50_ms']:>10.3f} {row['p95_ms']:>10.3f} "
+              f"{row['p99_ms']:>10.3f} {row['peak_alloc_kib_per_call']:>14.1f}")
+    return True
+
+def command_vfs_reset(args: list) -> bool:
+    count = reset_overlay(vfs["overlay"])
+    print(f"vfs-reset: discarded changes to {count} entries")
+    return True
+
+def command_vfs_stats(args: list) -> bool:
+    """Logical and physical size of file bodies.
+    
+    In-memory bodies are counted by the content store as they are loaded.
+    Bodies left in an mmap (--mmap, compiled images) bypass the store, so
+    they are counted here by walking the tree; identical bodies of an image
+    share one byte range and count once towards the physical size.
+    """
+    store = vfs["store"]
+    rows = [("content", store["logical"], store["physical"], f"{len(store['blobs'])} blobs")]
+    
+    ranges = set()
+    logical = 0
+    for path, node in walk_subtree("/", vfs["root"]):
+        if node.flags & NODE_MAPPED:
+            ranges.add((node.offset, node.length))
+            logical += node.length
+    if ranges:
+        physical = sum(length for offset, length in ranges)
+        rows.append(("mapped", logical, physical, f"{len(ranges)} ranges"))
+    
+    for label, logical, physical, pieces in rows:
+        ratio = logical / physical if physical else 1.0
+        print(f"{label}: logical {logical} bytes, physical {physical} bytes "
+              f"in {pieces} (dedup {ratio:.1f}x)")
+    return True
+
+class BufferedOutput:
+    """Output sink that hands text to stream in large pieces.
+
+    Installed as sys.stdout by main(). Writes are collected and passed on
+    once OUTPUT_BUFFER_SIZE characters are pending, and at every prompt:
+    input() flushes sys.stdout before reading a line.
+    """
+    
+    def __init__(self, stream, limit: int = None):
+        self.stream = stream
+        self.limit = OUTPUT_BUFFER_SIZE if limit is None else limit
+        self.parts = []
+        self.size = 0
+    
+    def write(self, text: str) -> int:
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.limit:
+            self.flush()
+        return len(text)
+    
+    def flush(self):
+        if self.parts:
+            self.stream.write("".join(self.parts))
+            self.parts.clear()
+            self.size = 0
+        self.stream.flush()
+    
+    # input() uses the terminal (and readline) only when stdout has the
+    # terminal's file descriptor
+    def fileno(self) -> int:
+        return self.stream.fileno()
+    
+    def isatty(self) -> bool:
+        return self.stream.isatty()
+    
+    @property
+    def encoding(self) -> str:
+        return self.stream.encoding
+
 def prompt_path():
     if vfs["current_dir"] == "/":
         return "~"
@@ -227,56 +2130,313 @@ def prompt_path():
 def build_prompt() -> str:
     return f"{USER}@{HOST}:{prompt_path()}$ "
 
-def execute_command(cmd: str, args: list) -> bool:
-    if cmd == "ls":
-        path = args[0] if args else vfs["current_dir"]
-        items = list_directory(path)
-        
-        if items is None:
-            print(f"ls: cannot access '{path}': No such file or directory")
-            return False
-        
-        if items:
-            print("  ".join(items))
+def command_ls(args: list) -> bool:
+    long_format = bool(args) and args[0] == "-l"
+    if long_format:
+        args = args[1:]
+    
+    path = args[0] if args else vfs["current_dir"]
+    if long_format:
+        return list_long(path)
+    
+    items = list_directory(path)
+    
+    if items is None:
+        print(f"ls: cannot access '{path}': No such file or directory")
+        return False
+    
+    if items:
+        print("  ".join(items))
+    return True
+
+def list_long(path: str) -> bool:
+    """ls -l: mode, owner, group, size and name of each entry.
+
+    Directories show the total size of their subtree from size_index(),
+    so the listing costs O(children) however large the subtrees are.
+    """
+    base = normalize_path(path)
+    node = find_node(base)
+    
+    if node is None:
+        print(f"ls: cannot access '{path}': No such file or directory")
+        return False
+    
+    if node.flags & NODE_DIRECTORY:
+        prefix = base.rstrip("/") + "/"
+        overlay = vfs["overlay"]
+        entries = [(name, prefix + name, overlay.get(prefix + name, child) if overlay else child)
+                   for name, child in sorted(node.children.items())]
+    else:
+        entries = [(path, base, node)]
+    
+    rows = []
+    for name, child_path, child in entries:
+        if child.flags & NODE_DIRECTORY:
+            rows.append(("drwxr-xr-x", child.owner, child.group, str(size_index()[child_path][0]), name))
+        else:
+            rows.append(("-rw-r--r--", child.owner, child.group, str(file_size(vfs["store"], child)), name))
+    
+    if not rows:
         return True
+    
+    owner_width = max(len(row[1]) for row in rows)
+    group_width = max(len(row[2]) for row in rows)
+    size_width = max(len(row[3]) for row in rows)
+    for mode, owner, group, size, name in rows:
+        print(f"{mode} {owner:<{owner_width}} {group:<{group_width}} {size:>{size_width}} {name}")
+    return True
+
+def human_size(size: int) -> str:
+    """Size with a K/M/G/... suffix, rounded up like du -h."""
+    if size < 1024:
+        return str(size)
+    
+    value = size
+    for unit in "KMGTPE":
+        value /= 1024
+        if value < 1024 or unit == "E":
+            break
+    
+    if value < 10:
+        return f"{math.ceil(value * 10) / 10:.1f}{unit}"
+    return f"{math.ceil(value)}{unit}"
+
+def directories_post_order(base: str, node: VfsNode) -> list:
+    """Paths of base and every directory below it, each after its subdirectories like du(1)."""
+    order = []
+    stack = [(base, node, False)]
+    
+    while stack:
+        path, node, visited = stack.pop()
+        if visited:
+            order.append(path)
+            continue
         
-    elif cmd == "cd":
-        if not args:
-            vfs["current_dir"] = "/"
-            return True
-        
-        if change_directory(args[0]):
-            return True
-        else:
-            print(f"cd: {args[0]}: No such file or directory")
-            return False
+        stack.append((path, node, True))
+        prefix = path.rstrip("/") + "/"
+        subdirs = sorted(name for name, child in node.children.items() if child.flags & NODE_DIRECTORY)
+        for name in reversed(subdirs):
+            stack.append((prefix + name, node.children[name], False))
     
-    elif cmd == "wc":
-        return command_wc(args)
+    return order
+
+def command_du(args: list) -> bool:
+    usage = "Usage: du [-s] [-h] [PATH]..."
+    try:
+        selected, targets = parse_short_flags(args, "sh")
+    except ValueError as e:
+        print(f"du: {e}")
+        print(usage)
+        return False
     
-    elif cmd == "history":
-        return show_command_history(args)
+    # Sizes are apparent sizes: bytes of text, in KiB rounded up unless -h
+    if "h" in selected:
+        show = human_size
+    else:
+        show = lambda size: str(-(-size // 1024))
     
-    elif cmd == "chown":
-        return command_chown(args)
+    sizes = size_index()
+    success = True
     
-    elif cmd == "vfs-load":
-        return command_vfs_load(args)
-            
-    elif cmd == "conf-dump":
-        print("Configuration parameters:")
-        print(f"vfs_path = {config['vfs_path']}")
-        print(f"startup_script = {config['startup_script']}")
-        print(f"vfs_name = {vfs['name']}")
-        print(f"current_dir = {vfs['current_dir']}")
-        print(f"commands_in_history = {len(command_history)}")
-        return True
+    for target in targets or ["."]:
+        base = normalize_path(target)
+        node = find_node(base)
+        if node is None:
+            print(f"du: cannot access '{target}': No such file or directory")
+            success = False
+            continue
+        
+        if not node.flags & NODE_DIRECTORY:
+            print(f"{show(file_size(vfs['store'], node))}\t{target}")
+            continue
+        if "s" in selected:
+            print(f"{show(sizes[base][0])}\t{target}")
+            continue
         
-    elif cmd == "exit":
+        display = target.rstrip("/")
+        for path in directories_post_order(base, node):
+            shown = display + path[len(base.rstrip("/")):] if path != base else target
+            print(f"{show(sizes[path][0])}\t{shown}")
+    
+    return success
+
+def command_cd(args: list) -> bool:
+    if not args:
+        vfs["current_dir"] = "/"
+        resolve_path.cache_clear()
+        return True
+    
+    if change_directory(args[0]):
         return True
     else:
+        print(f"cd: {args[0]}: No such file or directory")
+        return False
+
+def command_conf_dump(args: list) -> bool:
+    print("Configuration parameters:")
+    print(f"vfs_path = {config['vfs_path']}")
+    print(f"startup_script = {config['startup_script']}")
+    print(f"vfs_name = {vfs['name']}")
+    print(f"current_dir = {vfs['current_dir']}")
+    load_history()
+    print(f"commands_in_history = {len(command_history)}")
+    return True
+
+def command_exit(args: list) -> bool:
+    # The REPL stops before dispatching exit; inside scripts it is a no-op
+    return True
+
+# Built-in commands: name -> (handler, min_args, usage)
+commands = {}
+
+def register_command(name: str, handler, min_args: int = 0, usage: str = None):
+    """Add a built-in; handler(args) -> bool is called by execute_command().
+
+    With fewer than min_args arguments the handler is not called and a
+    "missing operand" message with usage is printed instead.
+    """
+    commands[name] = (handler, min_args, usage)
+
+register_command("ls", command_ls)
+register_command("cd", command_cd)
+register_command("wc", command_wc)
+register_command("du", command_du)
+register_command("history", show_command_history)
+register_command("chown", command_chown)
+register_command("find", command_find)
+register_command("grep", command_grep)
+register_command("vfs-load", command_vfs_load)
+register_command("vfs-compile", command_vfs_compile, 2, "vfs-compile <path_to_vfs.xml> <image>")
+register_command("vfs-stats", command_vfs_stats)
+register_command("vfs-reset", command_vfs_reset)
+register_command("stats", command_stats)
+register_command("conf-dump", command_conf_dump)
+register_command("exit", command_exit)
+
+def execute_command(cmd: str, args: list) -> bool:
+    # --serve sessions finish loads in run_session_line_locked() instead
+    if current_session is None:
+        finish_background_load()
+    
+    entry = commands.get(cmd)
+    if entry is None:
         print(f"{cmd}: command not found")
         return False
+    
+    handler, min_args, usage = entry
+    if len(args) < min_args:
+        print(f"{cmd}: missing operand")
+        if usage:
+            print(f"Usage: {usage}")
+        return False
+    
+    if not profile["enabled"]:
+        return handler(args)
+    
+    # Peak traced memory above what was in use when the command started
+    import tracemalloc
+    tracemalloc.reset_peak()
+    in_use = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        return handler(args)
+    finally:
+        elapsed = time.perf_counter() - start
+        record_timing(cmd, elapsed, max(0, tracemalloc.get_traced_memory()[1] - in_use))
+
+@lru_cache(maxsize=PARSED_LINE_CACHE_SIZE)
+def parse_command_line(line: str) -> tuple:
+    """shlex-split line into a tuple of words, memoized per line text."""
+    import shlex
+    return tuple(shlex.split(line, posix=True))
+
+def compile_startup_script(data: bytes):
+    """Tokenise a startup script once.
+
+    Returns (line_num, line, words, error) for every command line in order;
+    error is the shlex message for a line that fails to parse (words is then
+    None) and None otherwise.
+    """
+    import shlex
+    records = []
+    
+    for line_num, line in enumerate(data.decode("utf-8").splitlines(), 1):
+        line = line.strip()
+        
+        if not line or line.startswith("#"):
+            continue
+        
+        try:
+            records.append((line_num, line, tuple(shlex.split(line, posix=True)), None))
+        except ValueError as e:
+            records.append((line_num, line, None, str(e)))
+    
+    return records
+
+def script_cache_path(script_path: str) -> str:
+    import hashlib
+    key = hashlib.sha256(os.path.abspath(script_path).encode("utf-8")).hexdigest()
+    return os.path.join(config['script_cache_dir'], key + ".json")
+
+def load_startup_script(script_path: str):
+    """compile_startup_script() result for script_path, cached on disk.
+
+    The cache entry is reused as is while the script's size and mtime are
+    unchanged; otherwise the script is read and the entry is still reused
+    when its SHA-256 matches, and rewritten when it does not. Entries are
+    JSON, so a writable cache directory cannot run code in the shell.
+    """
+    import hashlib
+    import json
+    st = os.stat(script_path)
+    cache_path = script_cache_path(script_path) if config['script_cache_dir'] else None
+    cached = None
+    
+    if cache_path is not None:
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("version") != SCRIPT_CACHE_VERSION:
+                cached = None
+            else:
+                # JSON has no tuples; words go back to the tuples compile_startup_script() makes
+                cached["records"] = [(line_num, line, tuple(words) if words is not None else None, error)
+                                     for line_num, line, words, error in cached["records"]]
+        except Exception:
+            cached = None
+    
+    if cached is not None and (cached.get("size"), cached.get("mtime")) == (st.st_size, st.st_mtime_ns):
+        return cached["records"]
+    
+    with open(script_path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    
+    if cached is not None and cached.get("sha256") == digest:
+        records = cached["records"]
+    else:
+        records = compile_startup_script(data)
+    
+    if cache_path is not None:
+        entry = {
+            "version": SCRIPT_CACHE_VERSION,
+            "size": st.st_size,
+            "mtime": st.st_mtime_ns,
+            "sha256": digest,
+            "records": records
+        }
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # The cache is an optimisation only; run the script regardless
+            pass
+    
+    return records
 
 def execute_startup_script(script_path: str):
     print(f"\n{'='*50}")
@@ -284,8 +2444,7 @@ def execute_startup_script(script_path: str):
     print('='*50 + '\n')
     
     try:
-        with open(script_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        records = load_startup_script(script_path)
     except FileNotFoundError:
         print(f"ERROR: Startup script not found: {script_path}")
         return
@@ -293,29 +2452,24 @@ def execute_startup_script(script_path: str):
         print(f"ERROR: Failed to read startup script: {e}")
         return
     
-    for line_num, line in enumerate(lines, 1):
-        line = line.strip()
+    for line_num, line, words, error in records:
+        print(build_prompt() + line)
         
-        if not line or line.startswith("#"):
-            continue
+        if config['record_script_history']:
+            record_history(line)
         
-        print(build_prompt() + line)
+        if error is not None:
+            print(f"ERROR at line {line_num}: Parse error: {error}")
+            continue
         
-        command_history.append(line)
+        if not words:
+            continue
         
         try:
-            parts = shlex.split(line, posix=True)
-            if not parts:
-                continue
-                
-            cmd = parts[0]
-            args = parts[1:]
-            success = execute_command(cmd, args)
+            success = execute_command(words[0], list(words[1:]))
             
             if not success:
                 print(f"Warning: Command failed at line {line_num}, continuing...")
-        except ValueError as e:
-            print(f"ERROR at line {line_num}: Parse error: {e}")
         except Exception as e:
             print(f"ERROR at line {line_num}: {e}")
     
@@ -323,15 +2477,232 @@ def execute_startup_script(script_path: str):
     print("Startup script execution completed")
     print('='*50 + '\n')
 
+# Held by the --serve worker thread running a session's command, since
+# the command sees the session's state through the module globals
+session_lock = threading.Lock()
+
+# Connected --serve sessions and the one whose line is running (None outside
+# --serve and between lines); both guarded by session_lock
+serve_sessions = []
+current_session = None
+
+def new_session() -> dict:
+    """Per-client state of --serve mode.
+
+    The base VFS is shared; the session's own changes go to its overlay.
+    "notices" holds messages for the client that are printed ahead of the
+    output of its next line.
+    """
+    return {
+        "current_dir": "/",
+        "overlay": {},
+        "notices": [],
+        "history": deque(),
+        "history_index": {"next": 1, "lines": {}, "trigrams": None, "loaded": True, "file": None}
+    }
+
+def open_session() -> dict:
+    with session_lock:
+        session = new_session()
+        serve_sessions.append(session)
+    return session
+
+def close_session(session: dict):
+    with session_lock:
+        serve_sessions.remove(session)
+        reset_overlay(session["overlay"])
+
+def finish_session_load():
+    """finish_background_load() between the lines of --serve sessions.
+    
+    Its messages go to the session that started the load. A new VFS sends
+    every session back to / without its changes; the other sessions are
+    told so, since the load was not theirs.
+    """
+    import contextlib
+    loader = background_load["session"]
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        installed = finish_background_load()
+    
+    if out.getvalue():
+        if loader is not None:
+            loader["notices"].append(out.getvalue())
+        else:
+            print(out.getvalue(), end="")
+    if not installed:
+        return
+    
+    for session in serve_sessions:
+        count = reset_overlay(session["overlay"])
+        session["current_dir"] = "/"
+        if session is not loader:
+            session["notices"].append(
+                f"Another session loaded VFS '{vfs['name']}' from {config['vfs_path']}: "
+                f"current directory reset to root, changes to {count} entries discarded.\n")
+
+def run_session_line(session: dict, line: str):
+    """Run one client line with session's cwd and history swapped in.
+
+    Returns (output, keep_open); output ends with the session's next prompt.
+    Called from executor threads; session_lock makes the swap safe.
+    """
+    with session_lock:
+        return run_session_line_locked(session, line)
+
+def run_session_line_locked(session: dict, line: str):
+    global command_history, history_index, current_session
+    import contextlib
+    finish_session_load()
+    saved = (vfs["current_dir"], vfs["overlay"], command_history, history_index)
+    
+    vfs["current_dir"] = session["current_dir"]
+    vfs["overlay"] = session["overlay"]
+    command_history, history_index = session["history"], session["history_index"]
+    current_session = session
+    buf = io.StringIO()
+    keep_open = True
+    
+    try:
+        with contextlib.redirect_stdout(buf):
+            for notice in session["notices"]:
+                print(notice, end="")
+            session["notices"].clear()
+            if line.strip():
+                add_history_entry(line)
+                try:
+                    parts = parse_command_line(line)
+                    if parts and parts[0] == "exit":
+                        keep_open = False
+                    elif parts:
+                        execute_command(parts[0], list(parts[1:]))
+                except ValueError as e:
+                    print(f"parse error: {e}")
+                except Exception as e:
+                    print(f"error: {e}")
+            if keep_open:
+                print(build_prompt(), end="")
+    finally:
+        session["current_dir"] = vfs["current_dir"]
+        session["overlay"] = vfs["overlay"]
+        current_session = None
+        vfs["current_dir"], vfs["overlay"], command_history, history_index = saved
+    
+    return buf.getvalue(), keep_open
+
+async def serve_client(reader, writer):
+    import asyncio
+    # Commands run in executor threads so a long one does not stall the loop
+    # and every other client's I/O with it
+    loop = asyncio.get_running_loop()
+    session = await loop.run_in_executor(None, open_session)
+    output, keep_open = await loop.run_in_executor(None, run_session_line, session, "")
+    writer.write(f"Connected to VFS '{vfs['name']}'\n{output}".encode("utf-8"))
+    
+    try:
+        while keep_open:
+            await writer.drain()
+            data = await reader.readline()
+            if not data:
+                break
+            line = data.decode("utf-8", errors="replace").rstrip("\r\n")
+            output, keep_open = await loop.run_in_executor(None, run_session_line, session, line)
+            writer.write(output.encode("utf-8"))
+        await writer.drain()
+    except (ConnectionError, ValueError):
+        # ValueError: a line longer than the stream limit
+        pass
+    finally:
+        writer.close()
+        await loop.run_in_executor(None, close_session, session)
+
+async def run_server(socket_path: str):
+    import asyncio
+    import signal
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    
+    server = await asyncio.start_unix_server(serve_client, path=socket_path)
+    print(f"Serving VFS '{vfs['name']}' on {socket_path}")
+    sys.stdout.flush()
+    
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+    
+    try:
+        async with server:
+            await stopped.wait()
+    finally:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+    
+    print("Server stopped")
+
+def serve(socket_path: str):
+    import asyncio
+    # Sessions keep their history in memory; none of them owns the history file
+    config['history_file'] = None
+    fold_overlay(vfs["overlay"])
+    
+    try:
+        asyncio.run(run_server(socket_path))
+    except OSError as e:
+        print(f"ERROR: Cannot serve on {socket_path}: {e}")
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description='OS Shell Emulator - Variant 15')
     parser.add_argument('--vfs', dest='vfs_path', 
                         help='Path to VFS XML file')
     parser.add_argument('--startup', dest='startup_script',
                         help='Path to startup script')
+    parser.add_argument('--content-cache', dest='content_cache_size', type=int,
+                        default=config['content_cache_size'],
+                        help='Number of decoded base64 file bodies to keep cached (0 disables)')
+    parser.add_argument('--mmap', dest='mmap_content', action='store_true',
+                        help='Serve file contents from an mmap of the VFS file instead of loading them')
+    parser.add_argument('--vfs-compile', dest='compile', nargs=2, metavar=('XML', 'IMAGE'),
+                        help='Compile a VFS XML file into a binary image and exit')
+    parser.add_argument('--script-cache', dest='script_cache_dir',
+                        default=config['script_cache_dir'],
+                        help='Directory for compiled startup scripts (empty string disables the cache)')
+    parser.add_argument('--history-size', dest='history_size', type=int,
+                        default=config['history_size'],
+                        help='Number of commands kept in the history')
+    parser.add_argument('--history-file', dest='history_file',
+                        default=config['history_file'],
+                        help='File the history is appended to and loaded from (empty string disables it)')
+    parser.add_argument('--no-script-history', dest='record_script_history', action='store_false',
+                        help='Do not record startup script commands in the history')
+    parser.add_argument('--serve', dest='serve', metavar='PATH',
+                        help='Serve the VFS to many clients on a Unix domain socket instead of reading stdin')
+    parser.add_argument('--profile', action='store_true',
+                        help='Record per-command timings from startup (see the stats command)')
+    parser.add_argument('--profile-json', dest='profile_json', metavar='PATH',
+                        help='Write the recorded timings as JSON to PATH at exit')
+    parser.add_argument('--load-workers', dest='load_workers', type=int,
+                        default=config['load_workers'],
+                        help='Worker processes used to parse large VFS XML files and to grep '
+                             'large trees (1 disables)')
+    parser.add_argument('--no-grep-index', dest='grep_index', action='store_false',
+                        help='Scan every file in grep -r instead of building a trigram index')
     
     args = parser.parse_args()
     
+    config['content_cache_size'] = args.content_cache_size
+    config['mmap_content'] = args.mmap_content
+    config['compile'] = args.compile
+    config['load_workers'] = args.load_workers
+    config['grep_index'] = args.grep_index
+    config['script_cache_dir'] = args.script_cache_dir
+    config['history_size'] = args.history_size
+    config['history_file'] = args.history_file
+    config['record_script_history'] = args.record_script_history
+    config['serve'] = args.serve
+    config['profile_json'] = args.profile_json
+    if args.profile or args.profile_json:
+        set_profiling(True)
+    
     if args.vfs_path:
         config['vfs_path'] = args.vfs_path
     if args.startup_script:
@@ -339,6 +2710,13 @@ def parse_arguments():
 
 def main():
     parse_arguments()
+    sys.stdout = BufferedOutput(sys.stdout)
+    
+    if config['profile_json']:
+        atexit.register(dump_profile_json)
+    
+    if config['compile']:
+        sys.exit(0 if command_vfs_compile(config['compile']) else 1)
     
     print(f"Configuration:")
     print(f"VFS Path: {config['vfs_path']}")
@@ -346,7 +2724,7 @@ def main():
     print("-" * 50 + "\n")
     
     if config['vfs_path']:
-        load_vfs_from_xml(config['vfs_path'])
+        load_vfs_from_xml(config['vfs_path'], config['mmap_content'])
     else:
         print("No VFS specified. Using empty VFS.")
     
@@ -355,6 +2733,10 @@ def main():
     if config['startup_script']:
         execute_startup_script(config['startup_script'])
     
+    if config['serve']:
+        serve(config['serve'])
+        return
+    
     while True:
         try:
             line = input(build_prompt())
@@ -362,15 +2744,15 @@ def main():
             if not line.strip():
                 continue
             
-            command_history.append(line)
+            record_history(line)
             
             try:
-                parts = shlex.split(line, posix=True)
+                parts = parse_command_line(line)
                 if not parts:
                     continue
                     
                 cmd = parts[0]
-                args = parts[1:]
+                args = list(parts[1:])
                 
                 if cmd == "exit":
                     print("Exiting shell emulator...")
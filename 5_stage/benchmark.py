@@ -0,0 +1,283 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import resource
+import statistics
+import subprocess
+import contextlib
+import importlib.util
+
+from gen_vfs import generate_vfs
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SHELL_PATH = os.path.join(HERE, "5_stage.py")
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+OPERATIONS = ["load", "ls", "cd", "wc", "chown"]
+FIELDS = ["nodes", "operation", "median_ms", "min_ms", "repeat", "peak_rss_mb"]
+
+# Startup benchmark: milliseconds a shell may take over a bare interpreter
+STARTUP_TARGET_MS = 100.0
+STARTUP_TOP_IMPORTS = 10
+
+def load_shell():
+    spec = importlib.util.spec_from_file_location("shell", SHELL_PATH)
+    shell = importlib.util.module_from_spec(spec)
+    sys.modules["shell"] = shell
+    spec.loader.exec_module(shell)
+    return shell
+
+def timed(func, repeat: int) -> list:
+    """Milliseconds of repeat calls of func, with command output discarded."""
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            times.append((time.perf_counter() - start) * 1000)
+    return times
+
+def sample_paths(shell, count: int):
+    """Up to count directory and file paths spread over the tree, and the deepest directory."""
+    dirs, files = [], []
+    deepest = "/"
+    for path, node in shell.walk_subtree("/", shell.vfs["root"]):
+        if node.children is not None:
+            dirs.append(path)
+            if path.count("/") > deepest.count("/"):
+                deepest = path
+        else:
+            files.append(path)
+    
+    step_dirs = max(1, len(dirs) // count)
+    step_files = max(1, len(files) // count)
+    return dirs[::step_dirs][:count], files[::step_files][:count], deepest
+
+def run_size(xml_path: str, nodes: int, repeat: int) -> list:
+    """Time every operation on one generated VFS in this process."""
+    shell = load_shell()
+    shell.config['history_file'] = None
+    results = {}
+    
+    results["load"] = timed(lambda: shell.load_vfs_from_xml(xml_path), repeat)
+    dirs, files, deepest = sample_paths(shell, 100)
+    
+    def run_ls():
+        for path in dirs:
+            shell.execute_command("ls", [path])
+    
+    def run_cd():
+        for path in dirs:
+            shell.execute_command("cd", [path])
+            shell.execute_command("cd", [".."])
+        shell.execute_command("cd", [deepest])
+        shell.execute_command("cd", ["/"])
+    
+    def run_wc():
+        shell.execute_command("wc", files)
+    
+    def run_chown():
+        shell.execute_command("chown", ["-R", "bench:bench", "/"])
+        shell.execute_command("vfs-reset", [])
+    
+    results["ls"] = timed(run_ls, repeat)
+    results["cd"] = timed(run_cd, repeat)
+    results["wc"] = timed(run_wc, repeat)
+    results["chown"] = timed(run_chown, repeat)
+    
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return [{
+        "nodes": nodes,
+        "operation": op,
+        "median_ms": round(statistics.median(results[op]), 3),
+        "min_ms": round(min(results[op]), 3),
+        "repeat": repeat,
+        "peak_rss_mb": round(peak, 1)
+    } for op in OPERATIONS]
+
+def ensure_vfs(work_dir: str, nodes: int) -> str:
+    path = os.path.join(work_dir, f"bench_{nodes}.xml")
+    if not os.path.exists(path):
+        print(f"Generating {nodes} nodes -> {path}", file=sys.stderr)
+        generate_vfs(path, nodes)
+    return path
+
+def run_benchmarks(sizes: list, repeat: int, work_dir: str) -> list:
+    """Run each size in a fresh interpreter so peak memory is per size."""
+    rows = []
+    for nodes in sizes:
+        xml_path = ensure_vfs(work_dir, nodes)
+        print(f"Benchmarking {nodes} nodes...", file=sys.stderr)
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", xml_path,
+                               str(nodes), str(repeat)], capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            raise RuntimeError(f"benchmark of {nodes} nodes failed")
+        rows.extend(json.loads(proc.stdout))
+    return rows
+
+def compare(rows: list, baseline: list, threshold: float, min_delta_ms: float) -> list:
+    """Rows whose median is more than threshold slower than in baseline.
+
+    Slowdowns under min_delta_ms are timer noise and are not reported.
+    """
+    old = {(row["nodes"], row["operation"]): row for row in baseline}
+    regressions = []
+    for row in rows:
+        base = old.get((row["nodes"], row["operation"]))
+        if base is None or base["median_ms"] <= 0:
+            continue
+        ratio = row["median_ms"] / base["median_ms"]
+        if ratio > 1 + threshold and row["median_ms"] - base["median_ms"] >= min_delta_ms:
+            regressions.append((row, base, ratio))
+    return regressions
+
+def write_rows(rows: list, fmt: str, out):
+    if fmt == "json":
+        json.dump(rows, out, indent=2)
+        out.write("\n")
+    else:
+        out.write(",".join(FIELDS) + "\n")
+        for row in rows:
+            out.write(",".join(str(row[field]) for field in FIELDS) + "\n")
+
+def startup_command(script: str, importtime: bool = False) -> list:
+    """Command line that starts script and exits at once on an empty stdin."""
+    # The final shell keeps history on disk; the GUI stages need a window
+    extra = ["--history-file", ""] if os.path.samefile(script, SHELL_PATH) else ["--no-gui"]
+    return [sys.executable] + (["-X", "importtime"] if importtime else []) + [script] + extra
+
+def time_process(command: list, runs: int) -> list:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+def parse_importtime(stderr: str) -> list:
+    """(cumulative_ms, module) of the top-level imports in -X importtime output, slowest first."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        # Nested imports are indented under the module that triggered them
+        if len(fields) != 3 or not fields[1].strip().isdigit() or fields[2].startswith("  "):
+            continue
+        imports.append((int(fields[1]) / 1000, fields[2].strip()))
+    return sorted(imports, reverse=True)
+
+def run_startup(script: str, runs: int) -> dict:
+    """Median wall time from launch to exit of script, against a bare interpreter."""
+    bare = statistics.median(time_process([sys.executable, "-c", "pass"], runs))
+    times = time_process(startup_command(script), runs)
+    proc = subprocess.run(startup_command(script, importtime=True), stdin=subprocess.DEVNULL,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = parse_importtime(proc.stderr)
+    return {
+        "script": script,
+        "runs": runs,
+        "median_ms": round(statistics.median(times), 3),
+        "min_ms": round(min(times), 3),
+        "interpreter_ms": round(bare, 3),
+        "overhead_ms": round(statistics.median(times) - bare, 3),
+        "imports_ms": round(sum(ms for ms, _ in imports), 3),
+        "top_imports": [{"module": module, "cumulative_ms": round(ms, 3)}
+                        for ms, module in imports[:STARTUP_TOP_IMPORTS]]
+    }
+
+def write_startup(result: dict, fmt: str, out):
+    if fmt == "json":
+        json.dump(result, out, indent=2)
+        out.write("\n")
+        return
+    
+    out.write(f"{result['script']}: median {result['median_ms']} ms, min {result['min_ms']} ms "
+              f"over {result['runs']} runs\n")
+    out.write(f"bare interpreter {result['interpreter_ms']} ms, overhead {result['overhead_ms']} ms, "
+              f"top-level imports {result['imports_ms']} ms\n")
+    for entry in result["top_imports"]:
+        out.write(f"  {entry['cumulative_ms']:>8.3f} ms  {entry['module']}\n")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark the core shell operations on generated VFS trees')
+    parser.add_argument('--sizes', type=lambda s: [int(x) for x in s.split(",")], default=DEFAULT_SIZES,
+                        help='Comma-separated node counts (default: 1000,10000,100000,1000000)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Runs per operation; the median is reported')
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), "konfig_bench"),
+                        help='Directory for generated VFS files (reused between runs)')
+    parser.add_argument('--format', choices=["csv", "json"], default="csv",
+                        help='Output format')
+    parser.add_argument('--output', help='Write results to this file instead of stdout')
+    parser.add_argument('--save-baseline', metavar='PATH',
+                        help='Also save the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='Compare with a saved baseline and exit 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Slowdown counted as a regression (0.2 = 20%%)')
+    parser.add_argument('--min-delta', dest='min_delta_ms', type=float, default=1.0,
+                        help='Ignore slowdowns smaller than this many milliseconds')
+    parser.add_argument('--startup', nargs='?', const=SHELL_PATH, metavar='SCRIPT',
+                        help='Time shell startup instead (default script: 5_stage.py)')
+    parser.add_argument('--target-ms', type=float, default=STARTUP_TARGET_MS,
+                        help='Startup overhead over a bare interpreter that fails the run '
+                             '(default: %(default)s)')
+    parser.add_argument('--worker', nargs=3, metavar=('XML', 'NODES', 'REPEAT'),
+                        help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    
+    if args.worker:
+        xml_path, nodes, repeat = args.worker
+        json.dump(run_size(xml_path, int(nodes), int(repeat)), sys.stdout)
+        return
+    
+    if args.startup:
+        result = run_startup(args.startup, args.repeat)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                write_startup(result, args.format, f)
+        else:
+            write_startup(result, args.format, sys.stdout)
+        
+        if result["overhead_ms"] > args.target_ms:
+            print(f"SLOW STARTUP: {result['overhead_ms']} ms over the interpreter, "
+                  f"target {args.target_ms} ms", file=sys.stderr)
+            sys.exit(1)
+        return
+    
+    os.makedirs(args.work_dir, exist_ok=True)
+    rows = run_benchmarks(args.sizes, args.repeat, args.work_dir)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            write_rows(rows, args.format, f)
+    else:
+        write_rows(rows, args.format, sys.stdout)
+    
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            write_rows(rows, "json", f)
+    
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(rows, baseline, args.threshold, args.min_delta_ms)
+        for row, base, ratio in regressions:
+            print(f"REGRESSION: {row['operation']} at {row['nodes']} nodes: "
+                  f"{base['median_ms']} ms -> {row['median_ms']} ms ({ratio:.2f}x)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import os
+import sys
+import random
+import base64
+import argparse
+from collections import deque
+from xml.sax.saxutils import quoteattr, escape
+
+OWNERS = ["root", "alice", "bob", "carol", "dave"]
+GROUPS = ["users", "staff", "wheel"]
+
+WORDS = ["alpha", "beta", "gamma", "delta", "config", "value", "path", "node",
+         "server", "client", "error", "info", "debug", "data", "index", "cache",
+         "line", "file", "user", "group", "load", "store", "read", "write"]
+
+def make_bodies(count: int, size: int, rng: random.Random) -> list:
+    """count distinct text bodies of about size characters each."""
+    bodies = []
+    for _ in range(count):
+        words = []
+        length = 0
+        while length < size:
+            word = rng.choice(WORDS)
+            sep = "\n" if rng.random() < 0.1 else " "
+            words.append(word + sep)
+            length += len(word) + 1
+        bodies.append("".join(words)[:size])
+    return bodies
+
+def plan_tree(nodes: int, breadth: int, depth: int, dir_ratio: float, rng: random.Random) -> list:
+    """Decide the shape of the tree breadth-first.
+    
+    Returns one [file_count, child_dir_ids] entry per directory, the root
+    being directory 0. Directories hold up to breadth entries and only
+    directories above depth get subdirectories.
+    """
+    dirs = [[0, []]]
+    queue = deque([(0, 0)])
+    created = 0
+    
+    while queue and created < nodes:
+        dir_id, level = queue.popleft()
+        for _ in range(breadth):
+            if created >= nodes:
+                break
+            created += 1
+            if level + 1 < depth and rng.random() < dir_ratio:
+                dirs.append([0, []])
+                dirs[dir_id][1].append(len(dirs) - 1)
+                queue.append((len(dirs) - 1, level + 1))
+            else:
+                dirs[dir_id][0] += 1
+    
+    if created < nodes:
+        print(f"gen_vfs: tree is full at {created} nodes; raise --breadth, --depth or --dir-ratio",
+              file=sys.stderr)
+    return dirs
+
+def generate_vfs(path: str, nodes: int, breadth: int = 50, depth: int = 8, file_size: int = 200,
+                 base64_ratio: float = 0.2, dir_ratio: float = 0.1, distinct: int = 1024,
+                 seed: int = 0, name: str = "generated") -> int:
+    """Write a VFS XML file with about nodes entries; returns the node count."""
+    rng = random.Random(seed)
+    bodies = make_bodies(distinct, file_size, rng)
+    encoded = [base64.b64encode(body.encode("utf-8")).decode("ascii") for body in bodies]
+    dirs = plan_tree(nodes, breadth, depth, dir_ratio, rng)
+    count = 0
+    
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write(f"<vfs name={quoteattr(name)}>\n")
+        
+        # (directory id, indent) to fill in, or a closing/opening tag to write
+        stack = [(0, 1)]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                f.write(item)
+                continue
+            
+            dir_id, indent = item
+            pad = "  " * indent
+            file_count, children = dirs[dir_id]
+            
+            for i in range(file_count):
+                owner = rng.choice(OWNERS)
+                group = rng.choice(GROUPS)
+                body = rng.randrange(distinct)
+                if rng.random() < base64_ratio:
+                    f.write(f'{pad}<file name="f{i}.b64" owner="{owner}" group="{group}" encoding="base64">'
+                            f'{encoded[body]}</file>\n')
+                else:
+                    f.write(f'{pad}<file name="f{i}.txt" owner="{owner}" group="{group}">'
+                            f'{escape(bodies[body])}</file>\n')
+                count += 1
+            
+            # Pushed in reverse so subdirectories are written in order
+            for n, child in reversed(list(enumerate(children))):
+                owner = rng.choice(OWNERS)
+                stack.append(f"{pad}</directory>\n")
+                stack.append((child, indent + 1))
+                stack.append(f'{pad}<directory name="d{n}" owner="{owner}" group="users">\n')
+                count += 1
+        
+        f.write("</vfs>\n")
+    
+    return count
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Generate a synthetic VFS XML file')
+    parser.add_argument('output', help='Path of the XML file to write')
+    parser.add_argument('--nodes', type=int, default=10000,
+                        help='Number of files and directories to generate')
+    parser.add_argument('--breadth', type=int, default=50,
+                        help='Entries per directory')
+    parser.add_argument('--depth', type=int, default=8,
+                        help='Maximum directory depth')
+    parser.add_argument('--dir-ratio', type=float, default=0.1,
+                        help='Share of entries that are directories')
+    parser.add_argument('--file-size', type=int, default=200,
+                        help='Characters per file body')
+    parser.add_argument('--base64-ratio', type=float, default=0.2,
+                        help='Share of files stored base64-encoded')
+    parser.add_argument('--distinct', type=int, default=1024,
+                        help='Number of distinct file bodies')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed')
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    count = generate_vfs(args.output, args.nodes, args.breadth, args.depth, args.file_size,
+                         args.base64_ratio, args.dir_ratio, args.distinct, args.seed)
+    print(f"Wrote {count} nodes to {args.output} ({os.path.getsize(args.output)} bytes)")
+
+if __name__ == "__main__":
+    main()
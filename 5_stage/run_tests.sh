@@ -20,6 +20,45 @@ python3 5_stage.py --vfs vfs_test1.xml
 echo ""
 echo ""
 
+echo ">>> Тест 4: Этап 5 – замеры производительности"
+echo "Генерация синтетических VFS и замер load, ls, cd, wc, chown..."
+python3 benchmark.py --sizes 1000,10000 --repeat 3
+echo ""
+echo ""
+
+echo ">>> Тест 5: Этап 5 – режим сервера со стартовым скриптом"
+echo "Изменения из startup_test_serve.txt должны быть видны каждому клиенту..."
+SOCK=$(mktemp -u /tmp/konfig.XXXXXX.sock)
+python3 5_stage.py --history-file '' --vfs vfs_test2.xml --startup startup_test_serve.txt --serve "$SOCK" > /dev/null &
+SERVER=$!
+for i in $(seq 50); do [ -S "$SOCK" ] && break; sleep 0.1; done
+python3 - "$SOCK" <<'CLIENT'
+import socket
+import sys
+
+for client in (1, 2):
+    with socket.socket(socket.AF_UNIX) as s:
+        s.connect(sys.argv[1])
+        s.sendall(b"ls -l\nls -l docs\nexit\n")
+        output = b""
+        while True:
+            data = s.recv(65536)
+            if not data:
+                break
+            output += data
+    text = output.decode("utf-8")
+    print(text)
+    rows = {row[4]: row[1:3] for row in (line.rpartition("$ ")[2].split() for line in text.splitlines())
+            if len(row) == 5}
+    ok = (rows.get("config.txt") == ["zed", "admin"]
+          and rows.get("docs") == rows.get("readme.md") == rows.get("license.txt") == ["ops", "staff"])
+    print(f"Клиент {client}: {'OK' if ok else 'ОШИБКА'}")
+CLIENT
+kill $SERVER
+wait $SERVER
+echo ""
+echo ""
+
 echo "=========================================="
 echo " Все тесты Этапа 5 завершены."
 echo "=========================================="